@@ -142,3 +142,44 @@ STATICFILES_DIRS = (
 
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
+
+# Model training
+
+# Worker processes used to evaluate candidates in Automatic mode
+EASYML_TRAINING_WORKERS = int(os.environ.get('EASYML_TRAINING_WORKERS', os.cpu_count() or 1))
+
+# Unpickled models kept in memory by each web process for prediction
+EASYML_MODEL_CACHE_ENTRIES = int(os.environ.get('EASYML_MODEL_CACHE_ENTRIES', 16))
+EASYML_MODEL_CACHE_BYTES = int(os.environ.get('EASYML_MODEL_CACHE_BYTES', 512 * 1024 * 1024))
+
+# Fitted models are serialized with joblib into this store instead of the database
+EASYML_ARTIFACT_STORE = 'helpers.artifact_store.LocalArtifactStore'
+EASYML_ARTIFACT_ROOT = os.environ.get('EASYML_ARTIFACT_ROOT', os.path.join(BASE_DIR, 'artifacts'))
+EASYML_ARTIFACT_COMPRESS = 3
+
+# Online predictions arriving within the wait window (seconds) share one predict call
+EASYML_PREDICT_BATCH_ROWS = int(os.environ.get('EASYML_PREDICT_BATCH_ROWS', 1024))
+EASYML_PREDICT_BATCH_WAIT = float(os.environ.get('EASYML_PREDICT_BATCH_WAIT', 0.005))
+
+# Worker processes used to score blocks of a file in run_model (1 = in-process)
+EASYML_PREDICT_WORKERS = int(os.environ.get('EASYML_PREDICT_WORKERS', 1))
+
+# Background threads rendering scatter-matrix plots after upload
+EASYML_PLOT_WORKERS = int(os.environ.get('EASYML_PLOT_WORKERS', 1))
+
+# Partitioning of the CsvFileData table by file: '' (none), 'list' (one
+# partition per file) or 'hash'. Applied by migration 0026 on Postgres 11+.
+EASYML_CSVDATA_PARTITIONING = os.environ.get('EASYML_CSVDATA_PARTITIONING', '')
+EASYML_CSVDATA_HASH_PARTITIONS = int(os.environ.get('EASYML_CSVDATA_HASH_PARTITIONS', 16))
+
+# Parallel jobs for hyperparameter searches (-1 = every core). Candidate
+# workers in Automatic mode always search with a single job.
+EASYML_TUNING_JOBS = int(os.environ.get('EASYML_TUNING_JOBS', -1))
+
+# Models are also saved in a compact float32/int8 form, used for prediction
+# when it agrees with the original on held out rows
+EASYML_COMPACT_MODELS = os.environ.get('EASYML_COMPACT_MODELS', '1') == '1'
+
+# Also write every cell of new files to CsvFileData. Every reader uses the
+# columnar copy, so this is only needed by tools that still query the cells.
+EASYML_WRITE_CELL_ROWS = os.environ.get('EASYML_WRITE_CELL_ROWS', '0') == '1'
@@ -0,0 +1,227 @@
+import numpy as np
+
+from sklearn.base import BaseEstimator, ClassifierMixin, RegressorMixin
+
+from .constants import ANN_DEFAULT_PROBES, ANN_KMEANS_ITER, ANN_QUERY_BLOCK, ANN_SEED, ANN_TRAIN_ROWS_PER_LIST
+
+
+def _squared_distances(x, centers, center_norms=None):
+    if center_norms is None:
+        center_norms = np.einsum('ij,ij->i', centers, centers)
+
+    distances = np.einsum('ij,ij->i', x, x)[:, np.newaxis] - 2 * x.dot(centers.T) + center_norms
+    return np.maximum(distances, 0, out=distances)
+
+
+def _nearest_center(x, centers):
+    center_norms = np.einsum('ij,ij->i', centers, centers)
+    labels = np.empty(len(x), dtype=np.intp)
+    for start in range(0, len(x), ANN_QUERY_BLOCK):
+        block = x[start:start + ANN_QUERY_BLOCK]
+        labels[start:start + ANN_QUERY_BLOCK] = _squared_distances(block, centers, center_norms).argmin(axis=1)
+
+    return labels
+
+
+# Lloyd's k-means on a random subsample of the rows. Lists left empty are
+# reseeded from random rows so every list stays in use.
+def kmeans(x, n_clusters, n_iter=ANN_KMEANS_ITER, random_state=ANN_SEED):
+    rng = np.random.RandomState(random_state)
+    n_train = min(len(x), n_clusters * ANN_TRAIN_ROWS_PER_LIST)
+    x_train = x[rng.choice(len(x), n_train, replace=False)] if n_train < len(x) else x
+    x_train = x_train.astype(np.float64)
+
+    centers = x_train[rng.choice(len(x_train), n_clusters, replace=False)].copy()
+    for iteration in range(n_iter):
+        labels = _nearest_center(x_train, centers)
+        counts = np.bincount(labels, minlength=n_clusters)
+
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, x_train)
+        filled = counts > 0
+        new_centers = centers.copy()
+        new_centers[filled] = sums[filled] / counts[filled, np.newaxis]
+        new_centers[~filled] = x_train[rng.choice(len(x_train), int((~filled).sum()))]
+
+        moved = not np.allclose(new_centers, centers)
+        centers = new_centers
+        if not moved:
+            break
+
+    return centers
+
+
+class IVFIndex:
+    """An inverted file index over the rows of a matrix.
+
+    Rows are clustered into n_lists lists by k-means. A query scans only the
+    rows in the n_probe lists whose centroids are nearest to it, and ranks
+    them by exact Euclidean distance. Raising n_probe raises recall at the
+    cost of speed; n_probe = n_lists is an exact search. Rows are stored
+    once, as float32, ordered by list.
+    """
+
+    def __init__(self, x, n_lists, random_state=ANN_SEED):
+        x = np.asarray(x, dtype=np.float32)
+        n_lists = max(1, min(int(n_lists), len(x)))
+
+        self.centroids = kmeans(x, n_lists, random_state=random_state).astype(np.float32)
+        self.rows = np.empty((0, x.shape[1]), dtype=np.float32)
+        self.row_ids = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        self.add(x, np.arange(len(x)))
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    # Assigns new rows to their nearest lists. The centroids are not moved.
+    def add(self, x, row_ids):
+        x = np.asarray(x, dtype=np.float32)
+        labels = np.concatenate([np.repeat(np.arange(self.n_lists), np.diff(self.offsets)),
+                                 _nearest_center(x, self.centroids)])
+        order = np.argsort(labels, kind='mergesort')
+
+        self.rows = np.concatenate([self.rows, x])[order]
+        self.row_ids = np.concatenate([self.row_ids, np.asarray(row_ids, dtype=np.int64)])[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=self.n_lists))])
+
+    def search(self, x, k, n_probe):
+        """Returns (distances, row_ids) of the k nearest indexed rows to each
+        query, nearest first. Slots with no candidate have row_id -1."""
+        x = np.asarray(x, dtype=np.float32)
+        n_probe = max(1, min(int(n_probe), self.n_lists))
+
+        distances = np.empty((len(x), k), dtype=np.float32)
+        row_ids = np.empty((len(x), k), dtype=np.int64)
+        for start in range(0, len(x), ANN_QUERY_BLOCK):
+            block = slice(start, start + ANN_QUERY_BLOCK)
+            distances[block], row_ids[block] = self._search_block(x[block], k, n_probe)
+
+        return np.sqrt(distances), row_ids
+
+    # Scans the block list by list, so each list is compared with every query
+    # probing it in one matrix product, keeping a running top k per query
+    def _search_block(self, x, k, n_probe):
+        center_distances = _squared_distances(x, self.centroids)
+        if n_probe < self.n_lists:
+            probes = np.argpartition(center_distances, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), (len(x), self.n_lists))
+
+        best_distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        best_ids = np.full((len(x), k), -1, dtype=np.int64)
+        for list_num in np.unique(probes):
+            start, end = self.offsets[list_num], self.offsets[list_num + 1]
+            if start == end:
+                continue
+
+            queries = np.flatnonzero((probes == list_num).any(axis=1))
+            list_distances = _squared_distances(x[queries], self.rows[start:end])
+            list_ids = np.broadcast_to(self.row_ids[start:end], list_distances.shape)
+
+            merged_distances = np.hstack([best_distances[queries], list_distances])
+            merged_ids = np.hstack([best_ids[queries], list_ids])
+            if merged_distances.shape[1] > k:
+                keep = np.argpartition(merged_distances, k - 1, axis=1)[:, :k]
+                merged_distances = np.take_along_axis(merged_distances, keep, axis=1)
+                merged_ids = np.take_along_axis(merged_ids, keep, axis=1)
+
+            best_distances[queries], best_ids[queries] = merged_distances, merged_ids
+
+        order = np.argsort(best_distances, axis=1)
+        return np.take_along_axis(best_distances, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+
+def default_n_lists(n_rows):
+    return max(1, int(np.sqrt(n_rows)))
+
+
+class _IVFNeighbors(BaseEstimator):
+
+    def __init__(self, n_neighbors=5, weights='uniform', n_lists=None, n_probe=ANN_DEFAULT_PROBES, random_state=ANN_SEED):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    def _fit_index(self, x, y_encoded):
+        x = np.asarray(x)
+        n_lists = self.n_lists or default_n_lists(len(x))
+        self.index_ = IVFIndex(x, n_lists, random_state=self.random_state)
+        self._y = np.asarray(y_encoded)
+        return self
+
+    def _add_rows(self, x, y_encoded):
+        self.index_.add(x, np.arange(len(self._y), len(self._y) + len(x)))
+        self._y = np.concatenate([self._y, y_encoded])
+        return self
+
+    def kneighbors(self, x, n_neighbors=None):
+        return self.index_.search(x, n_neighbors or self.n_neighbors, self.n_probe)
+
+    # Neighbor weights, with missing neighbors (fewer candidates than k)
+    # weighted zero. Exact matches take all the weight, as in sklearn.
+    def _neighbor_weights(self, distances, row_ids):
+        found = row_ids >= 0
+        if self.weights != 'distance':
+            return found.astype(np.float64)
+
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distances.astype(np.float64)
+        exact = np.isinf(weights)
+        exact_rows = exact.any(axis=1)
+        weights[exact_rows] = exact[exact_rows]
+        weights[~found] = 0
+        return weights
+
+
+class IVFNeighborsClassifier(ClassifierMixin, _IVFNeighbors):
+
+    def fit(self, x, y):
+        self.classes_, y_encoded = np.unique(y, return_inverse=True)
+        return self._fit_index(x, y_encoded)
+
+    # Adds rows of known classes without reclustering
+    def partial_fit(self, x, y):
+        y_encoded = np.searchsorted(self.classes_, y)
+        if np.any(self.classes_[np.minimum(y_encoded, len(self.classes_) - 1)] != y):
+            raise ValueError("partial_fit cannot add new classes")
+
+        return self._add_rows(x, y_encoded)
+
+    def predict_proba(self, x):
+        distances, row_ids = self.kneighbors(x)
+        weights = self._neighbor_weights(distances, row_ids)
+        labels = self._y[np.maximum(row_ids, 0)]
+
+        votes = np.zeros((len(labels), len(self.classes_)))
+        np.add.at(votes, (np.arange(len(labels))[:, np.newaxis], labels), weights)
+        totals = votes.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1
+        return votes / totals
+
+    def predict(self, x):
+        return self.classes_[self.predict_proba(x).argmax(axis=1)]
+
+
+class IVFNeighborsRegressor(RegressorMixin, _IVFNeighbors):
+
+    def fit(self, x, y):
+        return self._fit_index(x, np.asarray(y, dtype=np.float64))
+
+    def partial_fit(self, x, y):
+        return self._add_rows(x, np.asarray(y, dtype=np.float64))
+
+    def predict(self, x):
+        distances, row_ids = self.kneighbors(x)
+        weights = self._neighbor_weights(distances, row_ids)
+        values = self._y[np.maximum(row_ids, 0)]
+
+        totals = weights.sum(axis=1)
+        totals[totals == 0] = 1
+        return (values * weights).sum(axis=1) / totals
@@ -0,0 +1,199 @@
+import hashlib
+import os
+import uuid
+import joblib
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from mainsite.models import MLModel
+
+# Estimators whose fitted arrays are large enough to be worth memory-mapping.
+# Their artifacts are written uncompressed, everything else is compressed.
+MMAP_ESTIMATORS = (DecisionTreeRegressor, RandomForestClassifier, RandomForestRegressor,
+                   KNeighborsClassifier, KNeighborsRegressor)
+
+COMPRESSED_SUFFIX = '.pkl.z'
+MMAP_SUFFIX = '.pkl'
+COMPACT_SUFFIX = '.compact.pkl'
+
+
+class ArtifactChecksumError(Exception):
+    pass
+
+
+class ArtifactStore:
+    """Interface for storing serialized models outside of the database.
+
+    An artifact is addressed by a relative reference string, which is what
+    MLModel.artifact_ref stores.
+    """
+
+    def save(self, ref, obj, compress=0):
+        raise NotImplementedError
+
+    def load(self, ref, mmap_mode=None):
+        raise NotImplementedError
+
+    def delete(self, ref):
+        raise NotImplementedError
+
+    def checksum(self, ref):
+        raise NotImplementedError
+
+    def signature(self, ref):
+        """Cheap value that changes whenever the artifact is rewritten."""
+        raise NotImplementedError
+
+
+class LocalArtifactStore(ArtifactStore):
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, ref):
+        return os.path.join(self.root, ref)
+
+    def save(self, ref, obj, compress=0):
+        path = self._path(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(obj, path, compress=compress)
+
+    def load(self, ref, mmap_mode=None):
+        return joblib.load(self._path(ref), mmap_mode=mmap_mode)
+
+    def delete(self, ref):
+        path = self._path(ref)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def checksum(self, ref):
+        digest = hashlib.sha256()
+        with open(self._path(ref), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    def signature(self, ref):
+        stat = os.stat(self._path(ref))
+        return stat.st_mtime_ns, stat.st_size
+
+
+_artifact_store = None
+
+# (ref, signature, checksum) of artifacts already hashed by this process
+_verified_artifacts = set()
+
+
+def get_artifact_store():
+    global _artifact_store
+    if _artifact_store is None:
+        store_class = import_string(settings.EASYML_ARTIFACT_STORE)
+        _artifact_store = store_class(settings.EASYML_ARTIFACT_ROOT)
+
+    return _artifact_store
+
+
+# Writes a fitted estimator to the artifact store and records the reference
+# and checksum on model_obj. The caller saves model_obj.
+def save_model_artifact(model_obj, model):
+    if isinstance(model, MMAP_ESTIMATORS):
+        ref = 'models/{}{}'.format(uuid.uuid4().hex, MMAP_SUFFIX)
+        compress = 0
+    else:
+        ref = 'models/{}{}'.format(uuid.uuid4().hex, COMPRESSED_SUFFIX)
+        compress = settings.EASYML_ARTIFACT_COMPRESS
+
+    store = get_artifact_store()
+    store.save(ref, model, compress=compress)
+
+    model_obj.artifact_ref = ref
+    model_obj.artifact_checksum = store.checksum(ref)
+    model_obj.data = None
+
+
+# Writes the compact form of a model uncompressed, so it loads memory-mapped.
+# The caller saves model_obj.
+def save_compact_artifact(model_obj, compact):
+    ref = 'models/{}{}'.format(uuid.uuid4().hex, COMPACT_SUFFIX)
+    store = get_artifact_store()
+    store.save(ref, compact, compress=0)
+    model_obj.compact_ref = ref
+    model_obj.compact_checksum = store.checksum(ref)
+
+
+# Moves a model still pickled inline in MLModel.data to the artifact store.
+# Only one of several concurrent migrations of a model is kept; the others
+# delete their artifact. Returns the estimator.
+def migrate_legacy_model(model_obj):
+    model = model_obj.data
+    if model is None:
+        return None
+
+    save_model_artifact(model_obj, model)
+    migrated = MLModel.objects.filter(id=model_obj.id, artifact_ref=None)\
+        .update(artifact_ref=model_obj.artifact_ref, artifact_checksum=model_obj.artifact_checksum, data=None)
+    if not migrated:
+        get_artifact_store().delete(model_obj.artifact_ref)
+        model_obj.refresh_from_db(fields=['artifact_ref', 'artifact_checksum', 'data'])
+
+    return model
+
+
+# Checks an artifact against the checksum taken when it was written. The file
+# is hashed once per process; later loads only compare its mtime and size,
+# so memory-mapped artifacts are not read in full on every cache miss.
+def verify_artifact(model_obj, ref, checksum):
+    if not checksum:
+        return
+
+    store = get_artifact_store()
+    key = (ref, store.signature(ref), checksum)
+    if key in _verified_artifacts:
+        return
+
+    if store.checksum(ref) != checksum:
+        raise ArtifactChecksumError('Checksum mismatch for model {} artifact {}'.format(model_obj.id, ref))
+
+    _verified_artifacts.add(key)
+
+
+# The artifact is verified before it is unpickled, so a corrupt or replaced
+# file is never loaded. Legacy inline models are migrated to the store on
+# first load.
+def load_model_artifact(model_obj):
+    if not model_obj.artifact_ref:
+        return migrate_legacy_model(model_obj)
+
+    ref = model_obj.artifact_ref
+    store = get_artifact_store()
+    verify_artifact(model_obj, ref, model_obj.artifact_checksum)
+
+    mmap_mode = None if ref.endswith(COMPRESSED_SUFFIX) else 'r'
+    return store.load(ref, mmap_mode=mmap_mode)
+
+
+# The model used for prediction: the compact form when there is one. It is
+# verified like the full artifact.
+def load_serving_model(model_obj):
+    if model_obj.compact_ref:
+        verify_artifact(model_obj, model_obj.compact_ref, model_obj.compact_checksum)
+        try:
+            return get_artifact_store().load(model_obj.compact_ref, mmap_mode='r')
+        except (ImportError, AttributeError):
+            # A compact form whose class no longer exists; the full model is used
+            pass
+
+    return load_model_artifact(model_obj)
+
+
+def delete_model_artifact(model_obj):
+    if model_obj.artifact_ref:
+        get_artifact_store().delete(model_obj.artifact_ref)
+    if model_obj.compact_ref:
+        get_artifact_store().delete(model_obj.compact_ref)
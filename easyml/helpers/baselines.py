@@ -0,0 +1,42 @@
+import pandas as pd
+
+# Straightforward implementations that optimized helpers replaced. They are
+# kept as references for the benchmark commands and the tests.
+
+
+# The loader get_dataframe replaced: one query per header, one model
+# instance per cell
+def per_column_dataframe(qry_data):
+    column_headers = qry_data.values_list('column_header', flat=True).distinct()
+    column_data = {}
+    for header in column_headers:
+        header_data = qry_data.filter(column_header=header).order_by('row_num')
+        column_data[header] = [d.data for d in header_data]
+
+    return pd.DataFrame.from_dict(column_data)
+
+
+# The per-element loops the vectorized metrics replaced
+def loop_r2(y_pred, y_test):
+    n = len(y_test)
+    y_bar = sum(y_test) / n
+    ss_tot = 0
+    ss_res = 0
+    for i in range(n):
+        ss_tot += (y_test[i] - y_bar)**2
+        ss_res += (y_test[i] - y_pred[i])**2
+
+    return round(1 - (ss_res/ss_tot), 4)
+
+
+def loop_match_acc(y_pred, y_test):
+    n = len(y_test)
+    if n == 0:
+        return 0
+
+    correct = 0
+    for i in range(n):
+        if y_pred[i] == y_test[i]:
+            correct += 1
+
+    return round((correct / n) * 100.0, 4)
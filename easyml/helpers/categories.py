@@ -0,0 +1,95 @@
+import threading
+import numpy as np
+
+from collections import OrderedDict
+
+from .constants import CATEGORY_CACHE_FILES
+from .util import get_file_version, get_itos_map, get_stoi_map
+
+
+class ColumnDecoder:
+    """Turns the integer codes of one categorical column back into strings.
+
+    Codes index straight into a lookup array, so decoding a column is one
+    vectorized pass however many categories it has. Values that are not a
+    known code are left unchanged.
+    """
+
+    def __init__(self, itos):
+        codes = np.array(list(itos.keys()), dtype=np.float64).astype(np.intp)
+        size = int(codes.max()) + 1 if len(codes) else 0
+
+        self.lookup = np.empty(size, dtype=object)
+        self.lookup[codes] = list(itos.values())
+        self.known = np.zeros(size, dtype=bool)
+        self.known[codes] = True
+
+    def decode(self, values):
+        values = np.asarray(values)
+        decoded = values.astype(object)
+
+        if values.dtype.kind not in 'biuf' or len(self.lookup) == 0:
+            return decoded
+
+        values = values.astype(np.float64)
+        with np.errstate(invalid='ignore'):
+            valid = np.isfinite(values) & (values >= 0) & (values < len(self.lookup)) & (values == np.floor(values))
+
+        positions = np.flatnonzero(valid)
+        codes = values[positions].astype(np.intp)
+        known = self.known[codes]
+        decoded[positions[known]] = self.lookup[codes[known]]
+
+        return decoded
+
+
+class FileCategories:
+    """The category dictionary of one file, in both directions."""
+
+    def __init__(self, itos_map, stoi_map):
+        self.itos_map = itos_map
+        self.stoi_map = stoi_map
+        self.decoders = {header: ColumnDecoder(itos) for header, itos in itos_map.items()}
+
+    def encode(self, header, value):
+        return self.stoi_map[header][value]
+
+    def decode(self, header, code):
+        return self.itos_map[header][code]
+
+
+_category_cache = OrderedDict()
+_category_lock = threading.Lock()
+
+
+# Entries are keyed on the file's data_version, so rows appended by any
+# process are seen on the next lookup. Old versions age out of the cache.
+def get_file_categories(file_id, version=None):
+    if version is None:
+        version = get_file_version(file_id)
+
+    key = (file_id, version)
+    with _category_lock:
+        categories = _category_cache.get(key)
+        if categories is not None:
+            _category_cache.move_to_end(key)
+            return categories
+
+    categories = FileCategories(get_itos_map(file_id), get_stoi_map(file_id))
+
+    with _category_lock:
+        _category_cache[key] = categories
+        while len(_category_cache) > CATEGORY_CACHE_FILES:
+            _category_cache.popitem(last=False)
+
+    return categories
+
+
+def get_column_decoders(file_id):
+    return get_file_categories(file_id).decoders
+
+
+def invalidate_file_categories(file_id):
+    with _category_lock:
+        for key in [key for key in _category_cache if key[0] == file_id]:
+            _category_cache.pop(key)
@@ -0,0 +1,337 @@
+import copy
+import numpy as np
+
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor
+from sklearn.neighbors.nearest_centroid import NearestCentroid
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC, SVR
+from sklearn.tree import DecisionTreeRegressor
+from sklearn.tree._tree import NODE_DTYPE, Tree
+
+from .constants import COMPACT_MIN_AGREEMENT, COMPACT_REGRESSION_TOL
+
+
+class CompactLinearModel:
+    """Weights of a linear model, as float32 or int8 with a float32 scale
+    per output. An input scaler is folded into the weights. Classifiers
+    predict the class with the highest score, or classes_[1] for a single
+    positive score."""
+
+    def __init__(self, coef, intercept, classes=None, quantize=False):
+        coef = np.atleast_2d(np.asarray(coef, dtype=np.float64))
+        if quantize:
+            scale = np.abs(coef).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            self.coef = np.round(coef / scale[:, np.newaxis]).astype(np.int8)
+            self.coef_scale = scale.astype(np.float32)
+        else:
+            self.coef = coef.astype(np.float32)
+            self.coef_scale = None
+
+        self.intercept = np.atleast_1d(np.asarray(intercept, dtype=np.float32))
+        self.classes_ = classes
+
+    @property
+    def quantized(self):
+        return self.coef_scale is not None
+
+    def decision_function(self, x):
+        scores = np.asarray(x, dtype=np.float32).dot(self.coef.T.astype(np.float32))
+        if self.coef_scale is not None:
+            scores *= self.coef_scale
+        scores += self.intercept
+        return scores
+
+    def predict(self, x):
+        scores = self.decision_function(x)
+        if self.classes_ is None:
+            return scores[:, 0] if scores.shape[1] == 1 else scores
+
+        if scores.shape[1] == 1:
+            return self.classes_[(scores[:, 0] > 0).astype(np.intp)]
+
+        return self.classes_[scores.argmax(axis=1)]
+
+
+class CompactGaussianNB:
+    """Class means and inverse variances as float32. The joint log
+    likelihood is computed with matrix products rather than per class."""
+
+    def __init__(self, model):
+        inv_var = 1.0 / model.sigma_
+        self.inv_var = inv_var.astype(np.float32)
+        self.weighted_theta = (model.theta_ * inv_var).astype(np.float32)
+        self.class_constant = (np.log(model.class_prior_)
+                               - 0.5 * np.sum(np.log(2.0 * np.pi * model.sigma_), axis=1)
+                               - 0.5 * np.sum(model.theta_ ** 2 * inv_var, axis=1))
+        self.classes_ = model.classes_
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        jll = (self.class_constant
+               - 0.5 * (x ** 2).dot(self.inv_var.T.astype(np.float64))
+               + x.dot(self.weighted_theta.T.astype(np.float64)))
+        return self.classes_[jll.argmax(axis=1)]
+
+
+class CompactNearestCentroid:
+
+    def __init__(self, model):
+        self.centroids = model.centroids_.astype(np.float32)
+        self.centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.classes_ = model.classes_
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        distances = self.centroid_norms - 2 * x.dot(self.centroids.T)
+        return self.classes_[distances.argmin(axis=1)]
+
+
+# The largest float32 at or below each threshold. sklearn compares float32
+# inputs with float64 thresholds, so this gives the same split for every
+# float32 input.
+def float32_thresholds(threshold):
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class CompactForest:
+    """The trees of a fitted forest (or a single tree) flattened into shared
+    arrays: int32 children and features, float32 thresholds, and float32
+    values for the leaves only. Impurities and sample counts are dropped.
+
+    Predictions run on sklearn trees rebuilt from the arrays on first use,
+    so they follow the same splits as the original; leaf values are the
+    class fractions (classifiers) or means (regressors), averaged over the
+    trees as sklearn does.
+    """
+
+    def __init__(self, trees, n_features, classes=None):
+        lefts, rights, features, thresholds, leaf_values, offsets, depths = [], [], [], [], [], [0], []
+        for tree in trees:
+            leaves = tree.children_left == -1
+            value = tree.value[:, 0, :]
+            if classes is not None:
+                value = value / value.sum(axis=1, keepdims=True)
+
+            lefts.append(tree.children_left)
+            rights.append(tree.children_right)
+            features.append(np.where(leaves, -2, tree.feature))
+            thresholds.append(float32_thresholds(tree.threshold))
+            leaf_values.append(value[leaves])
+            offsets.append(offsets[-1] + tree.node_count)
+            depths.append(tree.max_depth)
+
+        self.left = np.concatenate(lefts).astype(np.int32)
+        self.right = np.concatenate(rights).astype(np.int32)
+        self.feature = np.concatenate(features).astype(np.int32)
+        self.threshold = np.concatenate(thresholds)
+        self.leaf_value = np.concatenate(leaf_values).astype(np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.depths = np.asarray(depths, dtype=np.int32)
+        self.n_features = n_features
+        self.classes_ = classes
+        self._trees = None
+
+    @property
+    def n_trees(self):
+        return len(self.depths)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_trees'] = None
+        return state
+
+    def _rebuild_tree(self, tree_num):
+        start, end = self.offsets[tree_num], self.offsets[tree_num + 1]
+        leaves = self.left[start:end] == -1
+        leaf_start = int(np.count_nonzero(self.left[:start] == -1))
+
+        nodes = np.zeros(end - start, dtype=NODE_DTYPE)
+        nodes['left_child'] = self.left[start:end]
+        nodes['right_child'] = self.right[start:end]
+        nodes['feature'] = self.feature[start:end]
+        nodes['threshold'] = self.threshold[start:end]
+        nodes['threshold'][leaves] = -2
+
+        n_values = self.leaf_value.shape[1]
+        values = np.zeros((end - start, 1, n_values), dtype=np.float64)
+        values[leaves, 0, :] = self.leaf_value[leaf_start:leaf_start + int(np.count_nonzero(leaves))]
+
+        tree = Tree(self.n_features, np.array([n_values], dtype=np.intp), 1)
+        tree.__setstate__({'max_depth': int(self.depths[tree_num]), 'node_count': int(end - start),
+                           'nodes': nodes, 'values': values})
+        return tree
+
+    def _get_trees(self):
+        if self._trees is None:
+            self._trees = [self._rebuild_tree(tree_num) for tree_num in range(self.n_trees)]
+
+        return self._trees
+
+    def predict_values(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        totals = np.zeros((len(x), self.leaf_value.shape[1]))
+        for tree in self._get_trees():
+            totals += tree.predict(x)
+
+        return totals / self.n_trees
+
+    def predict_proba(self, x):
+        return self.predict_values(x)
+
+    def predict(self, x):
+        values = self.predict_values(x)
+        if self.classes_ is None:
+            return values[:, 0]
+
+        return self.classes_[values.argmax(axis=1)]
+
+
+class CompactNeighbors:
+    """The training rows of a nearest neighbors model as float32, with its
+    parameters. The model is refit on those rows on first use, which
+    rebuilds the search tree that the full pickle stores."""
+
+    def __init__(self, model):
+        self.model_class = type(model)
+        self.params = model.get_params()
+        self.x = np.asarray(model._fit_X, dtype=np.float32)
+        self.y = model.classes_[model._y] if hasattr(model, 'classes_') else np.asarray(model._y)
+        self.classes_ = getattr(model, 'classes_', None)
+        self._model = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_model'] = None
+        return state
+
+    def _get_model(self):
+        if self._model is None:
+            self._model = self.model_class(**self.params).fit(self.x, self.y)
+
+        return self._model
+
+    def predict(self, x):
+        return self._get_model().predict(np.asarray(x, dtype=np.float32))
+
+
+class CompactSVM:
+    """A fitted SVC or SVR whose support vectors are stored as float32. They
+    are restored to float64, which libsvm needs, on first use."""
+
+    def __init__(self, model):
+        self.support_vectors = np.asarray(model.support_vectors_, dtype=np.float32)
+        self.model = model
+        self.classes_ = getattr(model, 'classes_', None)
+        self._restored = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['model'] = copy.copy(self.model)
+        state['model'].support_vectors_ = None
+        state['_restored'] = False
+        return state
+
+    def predict(self, x):
+        if not self._restored:
+            self.model.support_vectors_ = self.support_vectors.astype(np.float64)
+            self._restored = True
+
+        return self.model.predict(x)
+
+
+# Folds a fitted StandardScaler into the weights of the linear model after it
+def _fold_scaler(scaler, coef, intercept):
+    coef = np.atleast_2d(coef)
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(coef.shape[1])
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(coef.shape[1])
+
+    folded = coef / scale
+    return folded, np.atleast_1d(intercept) - folded.dot(mean)
+
+
+def _linear_parts(model):
+    scaler = None
+    if isinstance(model, Pipeline):
+        if len(model.steps) != 2 or not isinstance(model.steps[0][1], StandardScaler):
+            return None
+        scaler, model = model.steps[0][1], model.steps[1][1]
+
+    if not isinstance(model, (LinearRegression, LogisticRegression, LinearDiscriminantAnalysis)):
+        return None
+
+    coef, intercept = model.coef_, model.intercept_
+    if scaler is not None:
+        coef, intercept = _fold_scaler(scaler, coef, intercept)
+
+    return coef, intercept, getattr(model, 'classes_', None)
+
+
+def to_compact(model, quantize=False):
+    """Returns the compact form of a fitted estimator, or None when there is
+    none. quantize stores linear weights as int8."""
+    linear = _linear_parts(model)
+    if linear is not None:
+        coef, intercept, classes = linear
+        return CompactLinearModel(coef, intercept, classes, quantize=quantize)
+
+    if isinstance(model, (RandomForestClassifier, RandomForestRegressor)):
+        return CompactForest([tree.tree_ for tree in model.estimators_], model.estimators_[0].tree_.n_features,
+                             getattr(model, 'classes_', None))
+
+    if isinstance(model, DecisionTreeRegressor):
+        return CompactForest([model.tree_], model.tree_.n_features)
+
+    if isinstance(model, (KNeighborsClassifier, KNeighborsRegressor)):
+        return CompactNeighbors(model)
+
+    if isinstance(model, (SVC, SVR)):
+        return CompactSVM(model)
+
+    if isinstance(model, GaussianNB):
+        return CompactGaussianNB(model)
+
+    if isinstance(model, NearestCentroid) and model.metric == 'euclidean':
+        return CompactNearestCentroid(model)
+
+    return None
+
+
+def predictions_match(model, compact, x):
+    expected = np.asarray(model.predict(x))
+    actual = np.asarray(compact.predict(x))
+    if getattr(compact, 'classes_', None) is not None:
+        return np.mean(expected == actual) >= COMPACT_MIN_AGREEMENT
+
+    tolerance = COMPACT_REGRESSION_TOL * max(float(np.std(expected)), 1e-12)
+    return float(np.max(np.abs(expected - actual))) <= tolerance
+
+
+def export_compact_model(model, check_rows):
+    """Returns a compact form of model whose predictions on check_rows agree
+    with the original, or None. Linear models are tried quantized to int8
+    first, then as float32."""
+    check_rows = np.asarray(check_rows, dtype=np.float64)
+    if not len(check_rows):
+        return None
+
+    for quantize in (True, False):
+        compact = to_compact(model, quantize=quantize)
+        if compact is None:
+            return None
+
+        if predictions_match(model, compact, check_rows):
+            return compact
+
+        if not isinstance(compact, CompactLinearModel):
+            return None
+
+    return None
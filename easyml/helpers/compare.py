@@ -0,0 +1,78 @@
+import hashlib
+
+from django.core.cache import cache
+
+from .categories import get_column_decoders
+from .constants import COMPARE_CACHE_SECONDS
+from .metrics import get_match_acc, get_r2
+from .util import get_column_values, get_file_version
+from mainsite.models import CsvFile
+
+
+# Returns (first, second, first_rows, second_rows) where first and second are
+# float arrays of the header's values in row order. Each file is read on its
+# own, from its column segments or, for legacy files, its cell rows, so a
+# columnar file can be compared with a legacy one. The arrays line up when
+# the row counts match.
+def get_aligned_columns(ffid, sfid, header):
+    first = get_column_values(ffid, header)
+    second = get_column_values(sfid, header)
+    return first, second, len(first), len(second)
+
+
+# Keys include each file's data_version from the database, so results
+# cached by any process are stale as soon as rows are appended
+def _comparison_key(ffid, sfid, header, method):
+    raw = '{}:{}:{}:{}:{}:{}'.format(ffid, sfid, header, method, get_file_version(ffid), get_file_version(sfid))
+    return 'compare:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def compare_file_columns(ffid, sfid, header, method):
+    key = _comparison_key(ffid, sfid, header, method)
+    context = cache.get(key)
+    if context is not None:
+        return context
+
+    first_data, second_data, first_rows, second_rows = get_aligned_columns(ffid, sfid, header)
+
+    if first_rows != second_rows:
+        messages = []
+        if second_rows == 0:
+            fname = CsvFile.objects.get(id=sfid).display_name
+            messages.append('Header "{}" does not exist in file "{}"'.format(header, fname))
+
+        messages.append('Length of the two files is not identical. {} vs {} rows.'
+                        .format(first_rows, second_rows))
+
+        return {
+            'status_code': 500,
+            'messages': messages
+        }
+
+    first_decoder = get_column_decoders(ffid).get(header)
+    if first_decoder:
+        first_data = first_decoder.decode(first_data)
+
+    second_decoder = get_column_decoders(sfid).get(header)
+    if second_decoder:
+        second_data = second_decoder.decode(second_data)
+
+    if 'accuracy' in method.lower():
+        acc = str(get_match_acc(first_data, second_data)) + "%"
+        accuracy_type = 'Accuracy'
+        method_sm = 'Accuracy'
+    else:
+        acc = get_r2(first_data, second_data)
+        accuracy_type = 'R^2'
+        method_sm = 'Correlation'
+
+    context = {
+        'status_code': 200,
+        'accuracy': acc,
+        'accuracy_type': accuracy_type,
+        'method_sm': method_sm,
+        'num_rows': first_rows,
+    }
+
+    cache.set(key, context, COMPARE_CACHE_SECONDS)
+    return context
@@ -1,10 +1,53 @@
 PLOT_FEATURE_CAP = 8
+PLOT_SAMPLE_ROWS = 2000
+PLOT_SAMPLE_SEED = 0
+DATA_LOAD_CHUNK_SIZE = 20000
+DATA_WRITE_CHUNK_SIZE = 5000
+UPLOAD_CHUNK_ROWS = 50000
+COLUMN_SEGMENT_ROWS = 50000
+PREDICT_CHUNK_ROWS = 50000
+JOB_POLL_INTERVAL = 2
+JOB_HEARTBEAT_SECONDS = 30
+JOB_STALE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 3
+CATEGORY_CACHE_FILES = 64
+COMPARE_CACHE_SECONDS = 60 * 60
+PURGE_BATCH_ROWS = 10000
+TUNING_PLATEAU_TOL = 0.001
+TUNING_HALVING_FACTOR = 3
+TUNING_RANDOM_ITER = 8
+TUNING_RANDOM_STATE = 0
+TRAINING_SPLIT_SEED = 0
+TRAINING_TEST_SIZE = 0.25
+SAMPLE_SEED = 0
+SAMPLE_MIN_ROWS = 200
+SAMPLE_PROGRESSIVE_START = 2000
+SAMPLE_PROGRESSIVE_GROWTH = 2
+SAMPLE_PROGRESSIVE_TOL = 0.005
+ANN_SEED = 0
+ANN_KMEANS_ITER = 20
+ANN_TRAIN_ROWS_PER_LIST = 256
+ANN_QUERY_BLOCK = 1024
+ANN_DEFAULT_PROBES = 8
+COMPACT_CHECK_ROWS = 2000
+COMPACT_MIN_AGREEMENT = 0.999
+COMPACT_REGRESSION_TOL = 0.001
+INCREMENTAL_LOGREG_ITER = 10
+TUNING_DEPTHS = [1, 10, 100, 1000, 10000]
+LOGREG_C_GRID = [0.0001, 0.001, 0.01, 0.1, 1, 10, 100, 1000]
 
 class COLUMN_TYPE:
     IGNORE = 0
     INPUT = 1
     TARGET = 2
 
+class JOB_STATUS:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
 class ALGORITHM:
     AUTOMATIC = 0
     LINEAR_REGRESSION = 1
@@ -46,17 +89,20 @@ ALGORITHM_NAME_MAP = {
     ALGORITHM.NEAREST_CENTROID: 'Nearest Centroid',
 }
 
+# Training options that apply whatever the algorithm
+SAMPLING_PARAMS = ['sample_mode', 'sample_size', 'sample_fraction']
+
 ALGORITHM_PARAM_MAP = {
     ALGORITHM.AUTOMATIC: ['auto_alg_type'],
     ALGORITHM.LINEAR_REGRESSION: ['linreg_normalize', 'linreg_fit_intercept'],
-    ALGORITHM.LOGISTIC_REGRESSION: ['logreg_fit_intercept', 'logreg_C', 'logreg_C_select', 'logreg_penalty'],
+    ALGORITHM.LOGISTIC_REGRESSION: ['logreg_fit_intercept', 'logreg_C', 'logreg_C_select', 'logreg_penalty', 'logreg_search'],
     ALGORITHM.LINEAR_DISCRIMINANT_ANALYSIS: ['lda_solver'],
     ALGORITHM.DECISION_TREE_REGRESSOR: ['dtr_criterion', 'dtr_presort', 'dtr_max_depth', 'dtr_custom_depth'],
     ALGORITHM.GAUSSIAN_NAIVE_BAYES: [],
     ALGORITHM.RANDOM_FOREST_CLASSIFIER: ['rfc_criterion', 'rfc_n_estimators', 'rfc_max_depth', 'rfc_custom_depth'],
     ALGORITHM.RANDOM_FOREST_REGRESSOR: ['rfr_criterion', 'rfr_n_estimators', 'rfr_max_depth', 'rfr_custom_depth'],
-    ALGORITHM.K_NEAREST_NEIGHBORS_CLASSIFIER: ['nnc_weights', 'nnc_algorithm', 'nnc_k', 'nnc_p'],
-    ALGORITHM.K_NEAREST_NEIGHBORS_REGRESSOR: ['nnr_weights', 'nnr_algorithm', 'nnr_k', 'nnr_p'],
+    ALGORITHM.K_NEAREST_NEIGHBORS_CLASSIFIER: ['nnc_weights', 'nnc_algorithm', 'nnc_k', 'nnc_p', 'nnc_n_lists', 'nnc_n_probe'],
+    ALGORITHM.K_NEAREST_NEIGHBORS_REGRESSOR: ['nnr_weights', 'nnr_algorithm', 'nnr_k', 'nnr_p', 'nnr_n_lists', 'nnr_n_probe'],
     ALGORITHM.SUPPORT_VECTOR_MACHINE_CLASSIFIER: ['svc_degree', 'svc_C', 'svc_kernel'],
     ALGORITHM.SUPPORT_VECTOR_MACHINE_REGRESSOR: ['svr_degree', 'svr_kernel'],
     ALGORITHM.NEAREST_CENTROID: [],
@@ -0,0 +1,195 @@
+import copy
+import json
+import math
+import numpy as np
+import warnings
+
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor
+from sklearn.pipeline import Pipeline
+
+from .ann import IVFNeighborsClassifier, IVFNeighborsRegressor
+from .artifact_store import load_model_artifact
+from .constants import ALGORITHM, ALGORITHM_NAME_MAP, INCREMENTAL_LOGREG_ITER
+from .metrics import get_match_acc
+from .model_builder import ALGORITHM_BUILDERS, build_training_data, save_model
+from .model_predict import get_model_columns
+from .training_data import TrainingData
+from .util import get_columns_dataframe
+
+
+class IncrementalUnsupported(Exception):
+    pass
+
+
+def _require_known_classes(model, y_new, exact=False):
+    new_classes = set(np.unique(y_new))
+    known_classes = set(model.classes_)
+    if not new_classes <= known_classes or (exact and new_classes != known_classes):
+        raise IncrementalUnsupported("New rows change the set of classes")
+
+
+def _update_naive_bayes(model, x_new, y_new, x_old, y_old):
+    _require_known_classes(model, y_new)
+    model.partial_fit(x_new, y_new)
+
+
+# New trees are grown on the new rows only, in proportion to their share of
+# all rows, and join the existing trees in the vote
+def _update_random_forest(model, x_new, y_new, x_old, y_old):
+    if isinstance(model, RandomForestClassifier):
+        _require_known_classes(model, y_new, exact=True)
+
+    new_trees = max(1, int(math.ceil(model.n_estimators * len(y_new) / (len(y_old) + len(y_new)))))
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + new_trees)
+    model.fit(x_new, y_new)
+    model.set_params(warm_start=False)
+
+
+# A few solver iterations on the new rows only, starting from the previous
+# coefficients, so the model moves toward the new rows without refitting the
+# old ones. A Pipeline keeps its fitted scaler. liblinear (l1 penalty) cannot
+# warm start.
+def _update_logistic_regression(model, x_new, y_new, x_old, y_old):
+    if isinstance(model, Pipeline):
+        scaler, logreg = model.steps[0][1], model.steps[-1][1]
+    else:
+        scaler, logreg = None, model
+
+    if logreg.solver == 'liblinear':
+        raise IncrementalUnsupported("liblinear cannot warm start")
+
+    # Every class must be present for the coefficients to be reused
+    _require_known_classes(logreg, y_new, exact=True)
+    if scaler is not None:
+        x_new = scaler.transform(x_new)
+
+    max_iter = logreg.max_iter
+    logreg.set_params(warm_start=True, max_iter=INCREMENTAL_LOGREG_ITER)
+    with warnings.catch_warnings():
+        # Stopping after a few iterations is intended
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        logreg.fit(x_new, y_new)
+    logreg.set_params(warm_start=False, max_iter=max_iter)
+
+
+# Exact neighbor models have nothing to update: this is a full rebuild of the
+# search index on the trained and new rows. IVF models update in place.
+def _update_nearest_neighbors(model, x_new, y_new, x_old, y_old):
+    model.fit(np.vstack([x_old, x_new]), np.concatenate([y_old, y_new]))
+
+
+# Index backed neighbor models assign the new rows to their existing lists
+def _update_approximate_neighbors(model, x_new, y_new, x_old, y_old):
+    if isinstance(model, IVFNeighborsClassifier):
+        _require_known_classes(model, y_new)
+
+    model.partial_fit(x_new, y_new)
+
+
+INCREMENTAL_UPDATERS = [
+    (GaussianNB, _update_naive_bayes),
+    ((RandomForestClassifier, RandomForestRegressor), _update_random_forest),
+    ((KNeighborsClassifier, KNeighborsRegressor), _update_nearest_neighbors),
+    ((IVFNeighborsClassifier, IVFNeighborsRegressor), _update_approximate_neighbors),
+    (LogisticRegression, _update_logistic_regression),
+]
+
+
+def _get_updater(model):
+    if isinstance(model, Pipeline) and isinstance(model.steps[-1][1], LogisticRegression):
+        return _update_logistic_regression
+
+    for estimator_types, updater in INCREMENTAL_UPDATERS:
+        if isinstance(model, estimator_types):
+            return updater
+
+    raise IncrementalUnsupported("{} cannot be updated incrementally".format(type(model).__name__))
+
+
+def update_model(model, x_new, y_new, x_old, y_old):
+    _get_updater(model)(model, x_new, y_new, x_old, y_old)
+    return model
+
+
+# The algorithm a model was trained with. Automatic models record the winning
+# algorithm in their type name.
+def get_model_algorithm(model_obj):
+    if model_obj.type_num != ALGORITHM.AUTOMATIC:
+        return model_obj.type_num
+
+    for alg_type_num, name in ALGORITHM_NAME_MAP.items():
+        if model_obj.type == 'Automatic_' + name:
+            return alg_type_num
+
+    return None
+
+
+def _score(model, x_test, y_test, accuracy_type):
+    if accuracy_type == 'R^2':
+        return round(model.score(x_test, y_test), 4)
+
+    return get_match_acc(model.predict(x_test), y_test)
+
+
+def retrain_model(base_model_obj, progress_callback=None):
+    """Trains the next version of a model on its file's current rows.
+
+    When the model records how many rows it was trained on and its estimator
+    supports it, only the rows added since then are used. The update is
+    scored on a held out part of the new rows. Anything else is retrained
+    from scratch with the same algorithm and settings.
+    """
+    parameters = json.loads(base_model_obj.parameters)
+    input_columns, target_column = get_model_columns(base_model_obj)
+    file_id = base_model_obj.parent_file_id
+
+    data_df = get_columns_dataframe(file_id, input_columns + [target_column])
+    input_df = data_df[input_columns]
+    y_all = data_df[target_column].values
+
+    trained_rows = parameters.get('trained_rows')
+    if trained_rows is not None and trained_rows >= len(y_all):
+        raise ValueError("No rows have been added since the model was trained")
+
+    parameters['base_model_id'] = base_model_obj.id
+    parameters['trained_rows'] = len(y_all)
+
+    if progress_callback:
+        progress_callback(0, 1)
+
+    # A held out part of the new rows is needed to score the update
+    model = None
+    if trained_rows and len(y_all) - trained_rows >= 2:
+        x_old = input_df.values[:trained_rows]
+        y_old = y_all[:trained_rows]
+        new_data = TrainingData(input_df.iloc[trained_rows:], y_all[trained_rows:])
+        base_model = load_model_artifact(base_model_obj)
+        try:
+            scored_model = update_model(copy.deepcopy(base_model), new_data.x_train, new_data.y_train, x_old, y_old)
+            model = update_model(base_model, new_data.x, new_data.y, x_old, y_old)
+        except IncrementalUnsupported:
+            model = None
+        else:
+            parameters['incremental'] = True
+            parameters['accuracy'] = _score(scored_model, new_data.x_test, new_data.y_test,
+                                            parameters.get('accuracy_type'))
+
+    if model is None:
+        alg_type_num = get_model_algorithm(base_model_obj)
+        if alg_type_num is None:
+            raise ValueError("The model's algorithm is unknown")
+
+        parameters['incremental'] = False
+        data = build_training_data(alg_type_num, input_df, y_all, parameters)
+        model = ALGORITHM_BUILDERS[alg_type_num](data, parameters)
+
+    if progress_callback:
+        progress_callback(1, 1)
+
+    return save_model(model, base_model_obj.type, base_model_obj.type_num, file_id, parameters,
+                      parameters['accuracy'], parameters['accuracy_type'],
+                      previous_version=base_model_obj, check_rows=input_df.values[trained_rows or 0:])
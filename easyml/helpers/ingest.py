@@ -0,0 +1,254 @@
+import io
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .constants import COLUMN_SEGMENT_ROWS, DATA_WRITE_CHUNK_SIZE
+from mainsite.models import CsvFile, CsvFileColumn, CsvFileData
+from .partitioning import create_file_partition, get_file_data_table
+from .util import (
+    bump_file_version,
+    get_file_row_count,
+    get_next_segment,
+    get_stoi_map,
+    save_file_categories,
+    save_file_columns,
+)
+
+CSV_DATA_COPY_COLUMNS = ['parent_file_id', 'column_header', 'data', 'placeholder', 'row_num', 'column_num', 'type']
+
+
+class ColumnEncoder:
+    """Assigns integer codes to the categorical values of one column.
+
+    Codes are handed out in order of first appearance and stay stable across
+    chunks, so a file read in pieces encodes the same as one read whole.
+    """
+
+    def __init__(self, codes=None):
+        self.codes = dict(codes) if codes else {}
+
+    def encode(self, values):
+        chunk_codes, uniques = pd.factorize(values)
+
+        lookup = np.empty(len(uniques), dtype=np.float64)
+        for i, value in enumerate(uniques):
+            if value not in self.codes:
+                self.codes[value] = len(self.codes)
+            lookup[i] = self.codes[value]
+
+        data = np.full(len(values), np.nan, dtype=np.float64)
+        valid = chunk_codes >= 0
+        data[valid] = lookup[chunk_codes[valid]]
+
+        placeholders = np.asarray(values, dtype=object).copy()
+        placeholders[~valid] = None
+
+        return data, placeholders
+
+
+# Object columns of a DataFrame chunk, i.e. columns with text in them
+def text_columns(chunk_df):
+    return {header for header in chunk_df.columns if chunk_df[header].dtype == object}
+
+
+# Reads every chunk once and returns the headers that have text in any of
+# them. Reading those columns as strings in a second pass encodes a file read
+# in chunks the same as one read whole.
+def find_text_columns(chunks):
+    headers = set()
+    for chunk_df in chunks:
+        headers |= text_columns(chunk_df)
+
+    return headers
+
+
+# Numbers in a categorical column are categories too, keyed by their text
+def _as_text(values):
+    values = np.asarray(values, dtype=object)
+    missing = pd.isnull(values)
+    text = values.astype(str)
+    return np.where(missing, None, text)
+
+
+class CsvDataWriter:
+    """Writes DataFrame chunks of one file into CsvFileColumn and, when
+    EASYML_WRITE_CELL_ROWS is set, CsvFileData.
+
+    Every chunk is stored as it arrives: each column of the chunk becomes one
+    segment blob, and categories first seen in the chunk are saved with it,
+    so only the category codes are kept between chunks. Cells are bulk loaded
+    with COPY on Postgres, straight into the file's own partition when the
+    table is list partitioned, and with bulk_create elsewhere.
+
+    A column is categorical once any chunk has text in it. The columns
+    listed in text_columns (or seeded by category_codes) are categorical from
+    the first chunk; a column that turns to text after numeric rows were
+    stored raises a ValueError, since those rows cannot be re-encoded.
+    category_codes ({header: {value: code}}) seeds the encoders, so a file
+    can share another file's codes. Passing the file's existing column_nums
+    and row count appends the chunks to it instead.
+    """
+
+    def __init__(self, file_obj, category_codes=None, column_nums=None, row_offset=0, column_types=None,
+                 text_columns=None):
+        self.file_obj = file_obj
+        self.encoders = {header: ColumnEncoder(codes) for header, codes in (category_codes or {}).items()}
+        self.column_nums = column_nums
+        self.row_offset = row_offset
+        self.column_types = column_types or {}
+        self.appending = column_nums is not None
+        self.text_columns = set(text_columns or ())
+        self.rows_written = 0
+        self.segment = get_next_segment(file_obj.id) if self.appending else 0
+
+        # Appends only save the codes the file does not have yet
+        self.saved_codes = {header: len(encoder.codes) if self.appending else 0
+                            for header, encoder in self.encoders.items()}
+        self.write_cells = settings.EASYML_WRITE_CELL_ROWS
+        if self.write_cells:
+            create_file_partition(file_obj.id)
+
+    def _encoder(self, header):
+        if header not in self.encoders:
+            if self.appending or self.rows_written:
+                raise ValueError('Column "{}" has text values, but earlier rows of it are numeric'.format(header))
+
+            self.encoders[header] = ColumnEncoder()
+            self.saved_codes[header] = 0
+
+        return self.encoders[header]
+
+    def _encode_column(self, header, values):
+        if header in self.encoders or header in self.text_columns or values.dtype == object:
+            column_values = values.values if values.dtype == object else _as_text(values.values)
+            return self._encoder(header).encode(column_values)
+
+        return values.values.astype(np.float64), None
+
+    def write_chunk(self, chunk_df):
+        if self.column_nums is None:
+            self.column_nums = {header: i for i, header in enumerate(chunk_df.columns)
+                                if 'unnamed' not in str(header).lower()}
+
+        missing = [header for header in self.column_nums if header not in chunk_df.columns]
+        if missing:
+            raise ValueError("Missing columns: {}".format(', '.join(str(header) for header in missing)))
+
+        row_start = self.row_offset + self.rows_written
+        row_nums = np.arange(row_start, row_start + len(chunk_df))
+        column_values = {}
+        cell_frames = []
+        for header, column_num in self.column_nums.items():
+            data, placeholders = self._encode_column(header, chunk_df[header])
+            column_values[header] = (column_num, data)
+            if self.write_cells:
+                cell_frames.append(pd.DataFrame({
+                    'parent_file_id': self.file_obj.id,
+                    'column_header': header,
+                    'data': data,
+                    'placeholder': placeholders,
+                    'row_num': row_nums,
+                    'column_num': column_num,
+                    'type': self.column_types.get(header),
+                }, columns=CSV_DATA_COPY_COLUMNS))
+
+        for start in range(0, len(chunk_df), COLUMN_SEGMENT_ROWS):
+            segment_values = {header: (column_num, data[start:start + COLUMN_SEGMENT_ROWS])
+                              for header, (column_num, data) in column_values.items()}
+            save_file_columns(self.file_obj, segment_values, self.segment, row_start + start, self.column_types)
+            self.segment += 1
+
+        self._save_new_codes()
+        if cell_frames:
+            self._write_cells(pd.concat(cell_frames, ignore_index=True))
+
+        self.rows_written += len(chunk_df)
+
+    # Saves the codes handed out since the last chunk. Codes are assigned in
+    # sequence, so the new ones are those past the saved count.
+    def _save_new_codes(self):
+        new_codes = {}
+        for header, encoder in self.encoders.items():
+            if header not in (self.column_nums or {}):
+                continue
+
+            saved = self.saved_codes.get(header, 0)
+            new_codes[header] = {value: code for value, code in encoder.codes.items() if code >= saved}
+            self.saved_codes[header] = len(encoder.codes)
+
+        save_file_categories(self.file_obj, new_codes)
+
+    def finish(self):
+        self._save_new_codes()
+
+    def _write_cells(self, cells_df):
+        if connection.vendor == 'postgresql':
+            self._copy_cells(cells_df)
+        else:
+            self._bulk_create_cells(cells_df)
+
+    def _copy_cells(self, cells_df):
+        buf = io.StringIO()
+        cells_df.to_csv(buf, index=False, header=False)
+        buf.seek(0)
+
+        sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+            connection.ops.quote_name(get_file_data_table(self.file_obj.id)),
+            ', '.join(connection.ops.quote_name(col) for col in CSV_DATA_COPY_COLUMNS))
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buf)
+
+    def _bulk_create_cells(self, cells_df):
+        csv_data = []
+        for cell in cells_df.itertuples(index=False):
+            csv_data.append(CsvFileData(parent_file_id=cell.parent_file_id,
+                                        column_header=cell.column_header,
+                                        data=None if np.isnan(cell.data) else cell.data,
+                                        placeholder=cell.placeholder,
+                                        row_num=cell.row_num,
+                                        column_num=cell.column_num,
+                                        type=cell.type))
+
+        CsvFileData.objects.bulk_create(csv_data, batch_size=DATA_WRITE_CHUNK_SIZE)
+
+
+def ingest_chunks(file_obj, chunks):
+    writer = CsvDataWriter(file_obj)
+    for chunk_df in chunks:
+        writer.write_chunk(chunk_df)
+
+    writer.finish()
+    return writer
+
+
+# Adds the rows of chunks to the end of an existing file. The chunks must
+# have every column of the file; their categories extend the file's codes.
+# The file row stays locked until the transaction ends, so concurrent
+# appends run one after another, each starting from the codes and row count
+# in the database.
+def append_chunks(file_obj, chunks):
+    with transaction.atomic():
+        CsvFile.all_objects.select_for_update().filter(id=file_obj.id).first()
+
+        columns = CsvFileColumn.objects.filter(parent_file=file_obj, segment=0)
+        column_nums = dict(columns.values_list('column_header', 'column_num'))
+        column_types = dict(columns.values_list('column_header', 'type'))
+        if not column_nums:
+            raise ValueError("Rows can only be appended to files stored with columnar data")
+
+        writer = CsvDataWriter(file_obj,
+                               category_codes=get_stoi_map(file_obj.id),
+                               column_nums=column_nums,
+                               row_offset=get_file_row_count(file_obj.id),
+                               column_types=column_types)
+        for chunk_df in chunks:
+            writer.write_chunk(chunk_df)
+
+        writer.finish()
+        bump_file_version(file_obj.id)
+
+    return writer
@@ -0,0 +1,180 @@
+import json
+import threading
+import traceback
+
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .constants import JOB_HEARTBEAT_SECONDS, JOB_MAX_ATTEMPTS, JOB_STALE_SECONDS, JOB_STATUS
+from .incremental import retrain_model
+from .model_builder import create_model
+from .tuning import set_tuning_checkpoint
+from mainsite.models import MLModel, TrainingJob
+
+
+class TrainingCancelled(Exception):
+    pass
+
+
+def enqueue_training_job(file_id, algorithm_type_num, parameters):
+    job = TrainingJob(parent_file_id=file_id,
+                      algorithm_type_num=algorithm_type_num,
+                      parameters=json.dumps(parameters))
+    job.save()
+
+    return job
+
+
+# Queues the next version of a model, trained on the rows added to its file
+def enqueue_retraining_job(model_obj):
+    return enqueue_training_job(model_obj.parent_file_id, model_obj.type_num, {'base_model_id': model_obj.id})
+
+
+def get_user_jobs(user):
+    return TrainingJob.objects.filter(parent_file__file_owner=user).order_by('-created_at')
+
+
+# Locks the oldest queued job so concurrent workers never pick up the same one
+def claim_next_job():
+    with transaction.atomic():
+        job = TrainingJob.objects.select_for_update(skip_locked=True)\
+            .filter(status=JOB_STATUS.QUEUED)\
+            .order_by('created_at')\
+            .first()
+
+        if not job:
+            return None
+
+        job.status = JOB_STATUS.RUNNING
+        job.started_at = timezone.now()
+        job.heartbeat_at = job.started_at
+        job.attempts += 1
+        job.save()
+
+    return job
+
+
+# Jobs left RUNNING by a worker that crashed or was killed stop getting
+# heartbeats. They are queued again, or failed once they have used up their
+# attempts; cancelled ones are marked cancelled. Returns the number recovered.
+def recover_stale_jobs():
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=JOB_STALE_SECONDS)
+    stale = TrainingJob.objects.filter(status=JOB_STATUS.RUNNING)\
+        .filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at=None, started_at__lt=cutoff))
+
+    recovered = stale.filter(cancel_requested=True)\
+        .update(status=JOB_STATUS.CANCELLED, finished_at=now)
+    recovered += stale.filter(attempts__gte=JOB_MAX_ATTEMPTS)\
+        .update(status=JOB_STATUS.FAILED, finished_at=now, message="The worker running this job stopped responding")
+    recovered += stale.update(status=JOB_STATUS.QUEUED, progress=0, started_at=None, heartbeat_at=None)
+
+    return recovered
+
+
+# This run of the job, which a recovered job no longer matches
+def _current_run(job):
+    return TrainingJob.objects.filter(id=job.id, status=JOB_STATUS.RUNNING, attempts=job.attempts)
+
+
+# Updates heartbeat_at until stopped or until the job is no longer this
+# run's. The connection is closed after each beat, so no open connection is
+# inherited by candidate workers forked in the meantime.
+def _send_heartbeats(job, stopped):
+    while not stopped.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            alive = _current_run(job).update(heartbeat_at=timezone.now())
+        except Exception:
+            traceback.print_exc()
+            alive = True
+        finally:
+            connection.close()
+
+        if not alive:
+            return
+
+
+def cancel_job(job):
+    if job.status == JOB_STATUS.QUEUED:
+        TrainingJob.objects.filter(id=job.id, status=JOB_STATUS.QUEUED)\
+            .update(status=JOB_STATUS.CANCELLED, finished_at=timezone.now())
+
+    TrainingJob.objects.filter(id=job.id).update(cancel_requested=True)
+    job.refresh_from_db()
+
+    return job
+
+
+def run_training_job(job):
+    # Also stops a run whose job was recovered and handed to another worker
+    def check_cancelled():
+        if not _current_run(job).filter(cancel_requested=False).exists():
+            raise TrainingCancelled()
+
+    def report_progress(done, total):
+        check_cancelled()
+        _current_run(job).update(progress=round(done / total, 4), heartbeat_at=timezone.now())
+
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_send_heartbeats, args=(job, stopped), daemon=True)
+    heartbeat.start()
+    set_tuning_checkpoint(check_cancelled)
+
+    parameters = json.loads(job.parameters)
+    try:
+        if parameters.get('base_model_id'):
+            base_model_obj = MLModel.objects.defer('data').get(id=parameters['base_model_id'])
+            model_obj = retrain_model(base_model_obj, progress_callback=report_progress)
+        else:
+            model_obj = create_model(job.algorithm_type_num,
+                                     job.parent_file_id,
+                                     parameters,
+                                     progress_callback=report_progress)
+    except TrainingCancelled:
+        job.status = JOB_STATUS.CANCELLED
+    except Exception as e:
+        traceback.print_exc()
+        job.status = JOB_STATUS.FAILED
+        job.message = repr(e)
+    else:
+        if model_obj:
+            job.status = JOB_STATUS.COMPLETE
+            job.progress = 1
+            job.result_model = model_obj
+        else:
+            job.status = JOB_STATUS.FAILED
+            job.message = "No data for file"
+    finally:
+        set_tuning_checkpoint(None)
+        stopped.set()
+        heartbeat.join()
+
+    # A run that was recovered as stale leaves the job to its new run
+    job.finished_at = timezone.now()
+    update = {'status': job.status, 'message': job.message, 'result_model': job.result_model,
+              'finished_at': job.finished_at}
+    if job.status == JOB_STATUS.COMPLETE:
+        update['progress'] = job.progress
+    if not _current_run(job).update(**update):
+        job.refresh_from_db()
+
+    return job
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'file_id': job.parent_file_id,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'cancel_requested': job.cancel_requested,
+        'model_id': job.result_model_id,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'heartbeat_at': job.heartbeat_at,
+        'attempts': job.attempts,
+    }
@@ -0,0 +1,112 @@
+import numpy as np
+
+# Clipping applied to probabilities before taking logs in get_log_loss
+LOG_LOSS_EPS = 1e-15
+
+
+def _to_array(values):
+    values = np.asarray(values)
+    if values.dtype.kind in 'USO':
+        return values.astype(object)
+
+    return values
+
+
+def _to_pair(y_pred, y_test):
+    y_pred = _to_array(y_pred)
+    y_test = _to_array(y_test)
+    if (y_pred.dtype == object) != (y_test.dtype == object):
+        y_pred = y_pred.astype(object)
+        y_test = y_test.astype(object)
+
+    return y_pred[:len(y_test)], y_test
+
+
+def get_r2(y_pred, y_test):
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    y_test = np.asarray(y_test, dtype=np.float64)
+    n = len(y_test)
+    y_bar = y_test.sum() / n
+    ss_tot = float(np.square(y_test - y_bar).sum())
+    ss_res = float(np.square(y_test - y_pred[:n]).sum())
+
+    return round(1 - (ss_res/ss_tot), 4)
+
+
+def get_match_acc(y_pred, y_test):
+    n = len(y_test)
+    if n == 0:
+        return 0
+
+    y_pred, y_test = _to_pair(y_pred, y_test)
+    correct = int(np.count_nonzero(y_pred == y_test))
+
+    return round((correct / n) * 100.0, 4)
+
+
+def get_mae(y_pred, y_test):
+    if len(y_test) == 0:
+        return 0
+
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    y_test = np.asarray(y_test, dtype=np.float64)
+
+    return round(float(np.abs(y_test - y_pred[:len(y_test)]).mean()), 4)
+
+
+def get_rmse(y_pred, y_test):
+    if len(y_test) == 0:
+        return 0
+
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    y_test = np.asarray(y_test, dtype=np.float64)
+
+    return round(float(np.sqrt(np.square(y_test - y_pred[:len(y_test)]).mean())), 4)
+
+
+# Returns (labels, matrix) where matrix[i][j] counts samples of true label i
+# predicted as label j
+def get_confusion_matrix(y_pred, y_test):
+    y_pred, y_test = _to_pair(y_pred, y_test)
+    labels, codes = np.unique(np.concatenate([y_test, y_pred]), return_inverse=True)
+    n = len(y_test)
+    n_labels = len(labels)
+
+    counts = np.bincount(codes[:n] * n_labels + codes[n:], minlength=n_labels * n_labels)
+
+    return labels, counts.reshape(n_labels, n_labels)
+
+
+# Macro-averaged F1 over every label seen in either array, as a percentage
+def get_f1(y_pred, y_test):
+    if len(y_test) == 0:
+        return 0
+
+    labels, matrix = get_confusion_matrix(y_pred, y_test)
+    true_pos = np.diag(matrix).astype(np.float64)
+    predicted = matrix.sum(axis=0)
+    actual = matrix.sum(axis=1)
+
+    denominator = predicted + actual
+    f1 = np.zeros(len(labels), dtype=np.float64)
+    nonzero = denominator > 0
+    f1[nonzero] = 2 * true_pos[nonzero] / denominator[nonzero]
+
+    return round(float(f1.mean()) * 100.0, 4)
+
+
+# y_proba holds one row per sample and one column per entry of labels, as
+# returned by predict_proba with labels = model.classes_
+def get_log_loss(y_proba, y_test, labels):
+    y_proba = np.clip(np.asarray(y_proba, dtype=np.float64), LOG_LOSS_EPS, 1 - LOG_LOSS_EPS)
+    y_proba = y_proba / y_proba.sum(axis=1, keepdims=True)
+
+    labels = _to_array(labels)
+    y_test = _to_array(y_test)
+    order = np.argsort(labels)
+    positions = np.searchsorted(labels, y_test, sorter=order)
+    positions = order[np.clip(positions, 0, len(labels) - 1)]
+    if not np.all(labels[positions] == y_test):
+        raise ValueError("y_test contains labels that are not in labels")
+
+    return round(float(-np.log(y_proba[np.arange(len(y_test)), positions]).mean()), 4)
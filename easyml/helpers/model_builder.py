@@ -1,6 +1,11 @@
 import json
 
-from sklearn.model_selection import train_test_split, GridSearchCV
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.db import connections
+from sklearn.base import clone
+from scipy.stats import reciprocal
+from sklearn.model_selection import GridSearchCV, RandomizedSearchCV
 from sklearn.linear_model import LogisticRegression, LinearRegression
 from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor
 from sklearn.neighbors.nearest_centroid import NearestCentroid
@@ -13,132 +18,246 @@ from sklearn.naive_bayes import GaussianNB
 from sklearn import svm
 
 from .constants import COLUMN_TYPE, ALGORITHM, ALGORITHM_NAME_MAP, ALGORITHM_TYPES
-from mainsite.models import CsvFile, CsvFileData, MLModel
-from .util import get_dataframe
+from .constants import ANN_DEFAULT_PROBES, COMPACT_CHECK_ROWS, LOGREG_C_GRID, TUNING_DEPTHS, TUNING_RANDOM_ITER, TUNING_RANDOM_STATE
+from mainsite.models import CsvFile, MLModel
+from .ann import IVFNeighborsClassifier, IVFNeighborsRegressor
+from .artifact_store import save_compact_artifact, save_model_artifact
+from .compact import export_compact_model
+from .sampling import get_sample_rows
+from .training_data import TrainingData
+from .tuning import get_tuning_jobs, limit_tuning_jobs, search_depths, successive_halving
+from .util import get_file_dataframe
 from .util import get_match_acc
 
 
-def create_model(algorithm_type_num, file_id, parameters):
-    file_data = CsvFileData.objects.filter(parent_file_id=file_id)\
-        .exclude(type=COLUMN_TYPE.IGNORE).order_by('column_num')
+def create_model(algorithm_type_num, file_id, parameters, progress_callback=None):
+    input_df = get_file_dataframe(file_id, COLUMN_TYPE.INPUT)
+    target_df = get_file_dataframe(file_id, COLUMN_TYPE.TARGET)
 
-    if file_data.count() == 0:
+    if input_df.empty or target_df.empty:
         print("Error: No data for file {}".format(file_id))
         return
 
-    input_data = file_data.filter(type=COLUMN_TYPE.INPUT).order_by('column_num')
-    target_data = file_data.filter(type=COLUMN_TYPE.TARGET)
-
     alg_type = ALGORITHM_NAME_MAP[algorithm_type_num]
 
-    input_df = get_dataframe(input_data)
-    target_df = get_dataframe(target_data)
+    # Recorded so the model can be served without its parent file's column types
+    parameters['input_columns'] = list(input_df.columns)
+    parameters['target_column'] = target_df.columns[0]
+    # Rows of the file at training time; later rows can be trained incrementally
+    parameters['trained_rows'] = len(target_df)
+
+    # Split once; every builder and candidate works from the same arrays
+    data = build_training_data(algorithm_type_num, input_df, target_df.values.ravel(), parameters)
+    del input_df, target_df
+
+    if algorithm_type_num != ALGORITHM.AUTOMATIC:
+        if progress_callback:
+            progress_callback(0, 1)
+
+        model = ALGORITHM_BUILDERS[algorithm_type_num](data, parameters)
+
+        if progress_callback:
+            progress_callback(1, 1)
+
+        return save_model(model, alg_type, algorithm_type_num, file_id, parameters,
+                          parameters['accuracy'], parameters['accuracy_type'],
+                          check_rows=data.x_test)
+
+    algorithm_type_nums = get_candidate_algorithms(parameters)
+    candidates = evaluate_candidates(algorithm_type_nums, data, parameters, progress_callback)
+    best_candidate = get_best_candidate(candidates)
+
+    if not best_candidate:
+        return
+
+    # Only the winning candidate is refit on the full data
+    alg_type_num, best_model, best_parameters = best_candidate
+    best_model.fit(data.x, data.y)
+    best_alg_type = 'Automatic_' + ALGORITHM_NAME_MAP[alg_type_num]
+
+    return save_model(best_model, best_alg_type, algorithm_type_num, file_id, best_parameters,
+                      best_parameters['accuracy'], best_parameters['accuracy_type'],
+                      check_rows=data.x_test)
+
+
+def get_candidate_algorithms(parameters):
+    if parameters['auto_alg_type'] == 'auto_classification':
+        return ALGORITHM_TYPES.CLASSIFICATION
 
-    target_df = target_df.values.ravel()
+    return ALGORITHM_TYPES.REGRESSION
 
-    algorithm_type_nums = [algorithm_type_num]
+
+def get_best_candidate(candidates):
+    best_acc = None
+    best_candidate = None
+    for candidate in candidates:
+        alg_type_num, model, candidate_parameters = candidate
+        if not best_acc or candidate_parameters['accuracy'] > best_acc:
+            best_acc = candidate_parameters['accuracy']
+            best_candidate = candidate
+
+    return best_candidate
+
+
+def is_classification(algorithm_type_num, parameters):
     if algorithm_type_num == ALGORITHM.AUTOMATIC:
-        alg_method = parameters['auto_alg_type']
-        if alg_method == 'auto_classification':
-            algorithm_type_nums = ALGORITHM_TYPES.CLASSIFICATION
+        return parameters.get('auto_alg_type') == 'auto_classification'
+
+    return algorithm_type_num in ALGORITHM_TYPES.CLASSIFICATION
+
+
+# Scores the requested algorithm (or every Automatic candidate) on a sample
+# of the rows, for growing a progressive sample
+def _sample_scorer(algorithm_type_num, input_df, target, parameters):
+    def score_rows(rows):
+        data = TrainingData(input_df.iloc[rows], target[rows])
+        if algorithm_type_num != ALGORITHM.AUTOMATIC:
+            sample_parameters = dict(parameters)
+            ALGORITHM_BUILDERS[algorithm_type_num](data, sample_parameters, final_fit=False)
         else:
-            algorithm_type_nums = ALGORITHM_TYPES.REGRESSION
+            candidates = evaluate_candidates(get_candidate_algorithms(parameters), data, parameters)
+            alg_type_num, model, sample_parameters = get_best_candidate(candidates)
 
-    best_acc = None
-    best_acc_type = None
-    best_model = None
-    temp_model = None
-    best_alg_type = alg_type
-    for alg_type_num in algorithm_type_nums:
-        if alg_type_num == ALGORITHM.LINEAR_REGRESSION:
-            temp_model = create_linear_regression_model(input_df, target_df, parameters)
+        return sample_parameters['accuracy'], sample_parameters['accuracy_type']
 
-        elif alg_type_num == ALGORITHM.K_NEAREST_NEIGHBORS_CLASSIFIER:
-            temp_model = create_k_nearest_neighbors_classifier(input_df, target_df, parameters)
+    return score_rows
 
-        elif alg_type_num == ALGORITHM.K_NEAREST_NEIGHBORS_REGRESSOR:
-            temp_model = create_k_nearest_neighbors_regressor(input_df, target_df, parameters)
 
-        elif alg_type_num == ALGORITHM.LOGISTIC_REGRESSION:
-            temp_model = create_logistic_regression_model(input_df, target_df, parameters)
+# The training data for a run, limited to a sample of the rows when the
+# parameters ask for one
+def build_training_data(algorithm_type_num, input_df, target, parameters):
+    rows = get_sample_rows(target, parameters,
+                           stratify=is_classification(algorithm_type_num, parameters),
+                           score_rows=_sample_scorer(algorithm_type_num, input_df, target, parameters))
+    if rows is None:
+        return TrainingData(input_df, target)
 
-        elif alg_type_num == ALGORITHM.NEAREST_CENTROID:
-            temp_model = create_nearest_centroid(input_df, target_df, parameters)
+    return TrainingData(input_df.iloc[rows], target[rows])
 
-        elif alg_type_num == ALGORITHM.LINEAR_DISCRIMINANT_ANALYSIS:
-            temp_model = create_linear_discriminant_analysis(input_df, target_df, parameters)
 
-        elif alg_type_num == ALGORITHM.DECISION_TREE_REGRESSOR:
-            temp_model = create_decision_tree_regressor(input_df, target_df, parameters)
+# Holds the training data for candidate workers, set once per worker process
+_candidate_data = {}
 
-        elif alg_type_num == ALGORITHM.GAUSSIAN_NAIVE_BAYES:
-            temp_model = create_gaussian_naive_bayes(input_df, target_df, parameters)
 
-        elif alg_type_num == ALGORITHM.RANDOM_FOREST_CLASSIFIER:
-            temp_model = create_random_forest_classifier(input_df, target_df, parameters)
+def _init_candidate_worker(data, tuning_jobs=None):
+    _candidate_data['data'] = data
+    if tuning_jobs is not None:
+        limit_tuning_jobs(tuning_jobs)
 
-        elif alg_type_num == ALGORITHM.RANDOM_FOREST_REGRESSOR:
-            temp_model = create_random_forest_regressor(input_df, target_df, parameters)
 
-        elif alg_type_num == ALGORITHM.SUPPORT_VECTOR_MACHINE_CLASSIFIER:
-            temp_model = create_support_vector_machine_classifier(input_df, target_df, parameters)
+# Scores one algorithm on a train/test split and returns an unfitted copy of the
+# configured estimator, so the pool never ships fitted models back to the parent
+def _score_candidate(alg_type_num, parameters):
+    parameters = dict(parameters)
+    model = ALGORITHM_BUILDERS[alg_type_num](_candidate_data['data'], parameters, final_fit=False)
 
-        elif alg_type_num == ALGORITHM.SUPPORT_VECTOR_MACHINE_REGRESSOR:
-            temp_model = create_support_vector_machine_regressor(input_df, target_df, parameters)
+    return alg_type_num, clone(model), parameters
 
-        if not best_acc or parameters['accuracy'] > best_acc:
-            best_acc = parameters['accuracy']
-            best_acc_type = parameters['accuracy_type']
-            best_model = temp_model
-            if algorithm_type_num == ALGORITHM.AUTOMATIC:
-                best_alg_type = 'Automatic_' + ALGORITHM_NAME_MAP[alg_type_num]
-            else:
-                best_alg_type = ALGORITHM_NAME_MAP[alg_type_num]
 
-    if best_model:
-        save_model(best_model, best_alg_type, algorithm_type_num, file_id, parameters, best_acc, best_acc_type)
+def evaluate_candidates(algorithm_type_nums, data, parameters, progress_callback=None):
+    total = len(algorithm_type_nums)
+    n_workers = min(settings.EASYML_TRAINING_WORKERS, total)
+    if progress_callback:
+        progress_callback(0, total)
 
+    results = {}
+    if n_workers <= 1:
+        _init_candidate_worker(data)
+        for alg_index, alg_type_num in enumerate(algorithm_type_nums):
+            results[alg_type_num] = _score_candidate(alg_type_num, parameters)
+            if progress_callback:
+                progress_callback(alg_index + 1, total)
+        _candidate_data.clear()
 
-def save_model(model, alg_type, algorithm_type_num, file_id, parameters, best_acc, best_acc_type):
+    else:
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_init_candidate_worker,
+                                 initargs=(data, 1)) as executor:
+            futures = [executor.submit(_score_candidate, alg_type_num, parameters)
+                       for alg_type_num in algorithm_type_nums]
+            try:
+                for done, future in enumerate(as_completed(futures)):
+                    alg_type_num, model, candidate_parameters = future.result()
+                    results[alg_type_num] = (alg_type_num, model, candidate_parameters)
+                    if progress_callback:
+                        progress_callback(done + 1, total)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    return [results[alg_type_num] for alg_type_num in algorithm_type_nums]
+
+
+def save_model(model, alg_type, algorithm_type_num, file_id, parameters, best_acc, best_acc_type,
+               previous_version=None, check_rows=None):
     parent_file = CsvFile.objects.get(id=file_id)
     display_name = "{}_{}".format(parent_file.display_name, alg_type)
 
-    same_name_count = MLModel.objects.filter(name=parent_file.display_name, type=alg_type).count()
-    if same_name_count > 0:
-        display_name += ' ({})'.format(same_name_count)
+    if previous_version:
+        display_name = "{}_v{}".format(previous_version.display_name, previous_version.version + 1)
+    else:
+        same_name_count = MLModel.objects.filter(name=parent_file.display_name, type=alg_type).count()
+        if same_name_count > 0:
+            display_name += ' ({})'.format(same_name_count)
 
     display_name = display_name.replace(' ', '_')
 
     model_obj = MLModel()
     model_obj.type = alg_type
     model_obj.type_num = algorithm_type_num
-    model_obj.data = model
+    save_model_artifact(model_obj, model)
+    parameters.pop('compact', None)
+    if settings.EASYML_COMPACT_MODELS and check_rows is not None:
+        save_compact_model(model_obj, model, check_rows, parameters)
     model_obj.name = parent_file.display_name
     model_obj.display_name = display_name
     model_obj.parameters = json.dumps(parameters)
     model_obj.parent_file = CsvFile.objects.get(id=file_id)
     model_obj.accuracy = best_acc
     model_obj.accuracy_type = best_acc_type
+    if previous_version:
+        model_obj.previous_version = previous_version
+        model_obj.version = previous_version.version + 1
     model_obj.save()
 
+    return model_obj
+
 
-def create_linear_regression_model(input_df, target_df, parameters):
+# Stores the compact form of a model when its predictions on check_rows
+# agree with the original, and records which form was stored
+def save_compact_model(model_obj, model, check_rows, parameters):
+    compact = export_compact_model(model, check_rows[:COMPACT_CHECK_ROWS])
+    if compact is None:
+        return False
+
+    save_compact_artifact(model_obj, compact)
+    parameters['compact'] = {
+        'format': type(compact).__name__,
+        'quantized': bool(getattr(compact, 'quantized', False)),
+    }
+    return True
+
+
+def create_linear_regression_model(data, parameters, final_fit=True):
     fit_intercept = bool(parameters.get('linreg_fit_intercept', False))
     normalize = bool(parameters.get('linreg_normalize', False))
 
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
     lin_reg = LinearRegression(fit_intercept=fit_intercept, normalize=normalize)
 
-    lin_reg_test = lin_reg.fit(x_train, y_train)
-    score = round(lin_reg_test.score(x_test, y_test), 4)
+    lin_reg_test = lin_reg.fit(data.x_train, data.y_train)
+    score = round(lin_reg_test.score(data.x_test, data.y_test), 4)
     parameters['accuracy'] = score
     parameters['accuracy_type'] = 'R^2'
-    lin_reg = lin_reg.fit(input_df, target_df)
+    if final_fit:
+        lin_reg.fit(data.x, data.y)
 
     return lin_reg
 
 
-def create_logistic_regression_model(input_df, target_df, parameters):
+def create_logistic_regression_model(data, parameters, final_fit=True):
     logreg_penalty = parameters.get('logreg_penalty', 'l2')
     logreg_c_select = parameters.get('logreg_C_select', 'custom')
     logreg_fit_intercept = bool(parameters.get('logreg_fit_intercept', False))
@@ -155,47 +274,79 @@ def create_logistic_regression_model(input_df, target_df, parameters):
                                     fit_intercept=logreg_fit_intercept,
                                     solver=solver)
 
+        clf_test = logreg.fit(data.x_train, data.y_train)
+        acc = get_match_acc(clf_test.predict(data.x_test), data.y_test)
+        parameters['accuracy'] = acc
+        parameters['accuracy_type'] = 'Accuracy [%]'
+
+        if final_fit:
+            logreg.fit(data.x, data.y)
+
+        return logreg
+
+    logreg = LogisticRegression(penalty=logreg_penalty,
+                                multi_class='auto',
+                                fit_intercept=logreg_fit_intercept,
+                                solver=solver)
+
+    # C is searched on the shared standardized training rows
+    x_train, x_test = data.scaled()
+    logreg_search = parameters.get('logreg_search', 'halving')
+    if logreg_search == 'grid':
+        search = GridSearchCV(estimator=logreg,
+                              param_grid={'C': LOGREG_C_GRID},
+                              cv=5,
+                              n_jobs=get_tuning_jobs())
+        best_params = search.fit(x_train, data.y_train).best_params_
+
+    elif logreg_search == 'random':
+        search = RandomizedSearchCV(estimator=logreg,
+                                    param_distributions={'C': reciprocal(min(LOGREG_C_GRID), max(LOGREG_C_GRID))},
+                                    n_iter=TUNING_RANDOM_ITER,
+                                    cv=5,
+                                    n_jobs=get_tuning_jobs(),
+                                    random_state=TUNING_RANDOM_STATE)
+        best_params = search.fit(x_train, data.y_train).best_params_
+
     else:
-        steps = [('std_scaler', StandardScaler())]
-        steps += [('log_regression', LogisticRegression(penalty=logreg_penalty,
-                                                        multi_class='auto',
-                                                        fit_intercept=logreg_fit_intercept,
-                                                        solver=solver))]
-        pipe = Pipeline(steps)
-
-        param_grid = {'log_regression__C': [0.0001, 0.001, 0.01, 0.1, 1, 10, 100, 1000]}
-        logreg = GridSearchCV(estimator=pipe, param_grid=param_grid, cv=5)
-
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-    clf_test = logreg.fit(x_train, y_train)
-    acc = get_match_acc(clf_test.predict(x_test), y_test)
+        candidates = [{'C': c} for c in LOGREG_C_GRID]
+        best_params, best_score = successive_halving(logreg, candidates, x_train, data.y_train, cv=5)
+
+    parameters['logreg_C_best'] = float(best_params['C'])
+    logreg.set_params(**best_params)
+
+    clf_test = logreg.fit(x_train, data.y_train)
+    acc = get_match_acc(clf_test.predict(x_test), data.y_test)
     parameters['accuracy'] = acc
     parameters['accuracy_type'] = 'Accuracy [%]'
 
-    clf = logreg.fit(input_df, target_df)
-    return clf
+    if not final_fit:
+        return Pipeline([('std_scaler', StandardScaler()), ('log_regression', logreg)])
+
+    # The served model standardizes its input with the scaler fitted on every row
+    logreg.fit(data.scaled(full=True), data.y)
+    return Pipeline([('std_scaler', data.scaler(full=True)), ('log_regression', logreg)])
 
 
-def create_linear_discriminant_analysis(input_df, target_df, parameters):
+def create_linear_discriminant_analysis(data, parameters, final_fit=True):
     solver = parameters.get('lda_solver', 'svd')
     clf = LinearDiscriminantAnalysis(solver=solver)
 
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-    clf_test = clf.fit(x_train, y_train)
-    acc = get_match_acc(clf_test.predict(x_test), y_test)
+    clf_test = clf.fit(data.x_train, data.y_train)
+    acc = get_match_acc(clf_test.predict(data.x_test), data.y_test)
     parameters['accuracy'] = acc
     parameters['accuracy_type'] = 'Accuracy [%]'
 
-    clf.fit(input_df, target_df)
+    if final_fit:
+        clf.fit(data.x, data.y)
 
     return clf
 
 
-def create_decision_tree_regressor(input_df, target_df, parameters):
+def create_decision_tree_regressor(data, parameters, final_fit=True):
     criterion = parameters.get('dtr_criterion', 'mse')
     presort = bool(parameters.get('dtr_presort', False))
     max_depth_choice = parameters.get('dtr_max_depth', 'none')
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
 
     if max_depth_choice == 'none':
         best_depth = None
@@ -204,55 +355,43 @@ def create_decision_tree_regressor(input_df, target_df, parameters):
         best_depth = parameters.get('dtr_custom_depth', None)
 
     else:
-        r2_lst = []
-        depth_iter = 5
-        depth_start = 10
-
-        depth_lst = []
-        for i in range(depth_iter):
-            depth_lst.append(depth_start**i)
-
         # Select model with best r^2 and least depth
-        for depth in depth_lst:
-            dt_regr = DecisionTreeRegressor(max_depth=depth, presort=presort, criterion=criterion)
-            dt_regr.fit(x_train, y_train)
-            r2_lst.append(dt_regr.score(x_test, y_test))
-
-        depth_index, r2 = min(enumerate(r2_lst), key=lambda x: abs(x[1] - 1))
-        best_depth = depth_lst[depth_index]
+        dt_regr = DecisionTreeRegressor(presort=presort, criterion=criterion)
+        best_depth, depth_scores = search_depths(dt_regr, TUNING_DEPTHS,
+                                                 data.x_train, data.y_train, data.x_test, data.y_test)
 
     dt_regr = DecisionTreeRegressor(max_depth=best_depth,
                                     presort=presort,
                                     criterion=criterion)
 
-    regr_test = dt_regr.fit(x_train, y_train)
-    score = round(regr_test.score(x_test, y_test), 4)
+    regr_test = dt_regr.fit(data.x_train, data.y_train)
+    score = round(regr_test.score(data.x_test, data.y_test), 4)
     parameters['accuracy'] = score
     parameters['accuracy_type'] = 'R^2'
 
-    dt_regr.fit(input_df, target_df)
+    if final_fit:
+        dt_regr.fit(data.x, data.y)
 
     return dt_regr
 
 
-def create_gaussian_naive_bayes(input_df, target_df, parameters):
+def create_gaussian_naive_bayes(data, parameters, final_fit=True):
     gnb = GaussianNB()
 
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-    clf_test = gnb.fit(x_train, y_train)
-    acc = get_match_acc(clf_test.predict(x_test), y_test)
+    clf_test = gnb.fit(data.x_train, data.y_train)
+    acc = get_match_acc(clf_test.predict(data.x_test), data.y_test)
     parameters['accuracy'] = acc
     parameters['accuracy_type'] = 'Accuracy [%]'
 
-    gnb.fit(input_df, target_df)
+    if final_fit:
+        gnb.fit(data.x, data.y)
     return gnb
 
 
-def create_random_forest_classifier(input_df, target_df, parameters):
+def create_random_forest_classifier(data, parameters, final_fit=True):
     criterion = parameters.get('rfc_criterion', 'gini')
     n_estimators = int(parameters.get('rfc_n_estimators', 100))
     depth_select = parameters.get('rfc_max_depth', 'none')
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
 
     if depth_select == 'none':
         best_depth = None
@@ -261,44 +400,31 @@ def create_random_forest_classifier(input_df, target_df, parameters):
         best_depth = parameters.get('rfc_custom_depth', None)
 
     else:
-        r2_lst = []
-        depth_iter = 5
-        depth_start = 10
-
-        depth_lst = []
-        for i in range(depth_iter):
-            depth_lst.append(depth_start**i)
-
-        # Select model with best r^2 and least depth
-        for depth in depth_lst:
-            rf_clf = RandomForestClassifier(n_estimators=n_estimators,
-                                            max_depth=depth,
-                                            criterion=criterion,
-                                            oob_score=True)
-            rf_clf.fit(x_train, y_train)
-            r2_lst.append(rf_clf.oob_score_)
-
-        depth_index, r2 = min(enumerate(r2_lst), key=lambda x: abs(x[1] - 1))
-        best_depth = depth_lst[depth_index]
+        # Select model with best out-of-bag score and least depth
+        rf_clf = RandomForestClassifier(n_estimators=n_estimators,
+                                        criterion=criterion,
+                                        oob_score=True)
+        best_depth, depth_scores = search_depths(rf_clf, TUNING_DEPTHS,
+                                                 data.x_train, data.y_train, data.x_test, data.y_test)
 
     rf_clf = RandomForestClassifier(n_estimators=n_estimators,
                                     max_depth=best_depth,
                                     criterion=criterion)
 
-    clf_test = rf_clf.fit(x_train, y_train)
-    acc = get_match_acc(clf_test.predict(x_test), y_test)
+    clf_test = rf_clf.fit(data.x_train, data.y_train)
+    acc = get_match_acc(clf_test.predict(data.x_test), data.y_test)
     parameters['accuracy'] = acc
     parameters['accuracy_type'] = 'Accuracy [%]'
 
-    rf_clf.fit(input_df, target_df)
+    if final_fit:
+        rf_clf.fit(data.x, data.y)
     return rf_clf
 
 
-def create_random_forest_regressor(input_df, target_df, parameters):
+def create_random_forest_regressor(data, parameters, final_fit=True):
     criterion = parameters.get('rfc_criterion', 'mse')
     n_estimators = int(parameters.get('rfc_n_estimators', 100))
     depth_select = parameters.get('rfc_max_depth', 'none')
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
 
     if depth_select == 'none':
         best_depth = None
@@ -307,129 +433,137 @@ def create_random_forest_regressor(input_df, target_df, parameters):
         best_depth = parameters.get('rfc_custom_depth', None)
 
     else:
-        r2_lst = []
-        depth_iter = 5
-        depth_start = 10
-
-        depth_lst = []
-        for i in range(depth_iter):
-            depth_lst.append(depth_start**i)
-
-        # Select model with best r^2 and least depth
-        for depth in depth_lst:
-            rf_regr_test = RandomForestRegressor(n_estimators=n_estimators,
-                                                 max_depth=depth,
-                                                 criterion=criterion,
-                                                 oob_score=True)
-            rf_regr_test.fit(x_train, y_train)
-            r2_lst.append(rf_regr_test.oob_score_)
-
-        depth_index, r2 = min(enumerate(r2_lst), key=lambda x: abs(x[1] - 1))
-        best_depth = depth_lst[depth_index]
+        # Select model with best out-of-bag r^2 and least depth
+        rf_regr_test = RandomForestRegressor(n_estimators=n_estimators,
+                                             criterion=criterion,
+                                             oob_score=True)
+        best_depth, depth_scores = search_depths(rf_regr_test, TUNING_DEPTHS,
+                                                 data.x_train, data.y_train, data.x_test, data.y_test)
 
     rf_regr = RandomForestRegressor(n_estimators=n_estimators,
                                     max_depth=best_depth,
                                     criterion=criterion)
 
-    regr_test = rf_regr.fit(x_train, y_train)
-    score = round(regr_test.score(x_test, y_test), 4)
+    regr_test = rf_regr.fit(data.x_train, data.y_train)
+    score = round(regr_test.score(data.x_test, data.y_test), 4)
     parameters['accuracy'] = score
     parameters['accuracy_type'] = 'R^2'
 
-    rf_regr.fit(input_df, target_df)
+    if final_fit:
+        rf_regr.fit(data.x, data.y)
 
     return rf_regr
 
 
-def create_k_nearest_neighbors_classifier(input_df, target_df, parameters):
-    n_neighbors = int(parameters.get('nnc_k', 5))
-    weights = parameters.get('weights', 'uniform')
-    algorithm = parameters.get('algorithm', 'auto')
-    p = int(parameters.get('nnc_p', 2))
+# The approximate backend is an inverted file index; the rest are sklearn's
+# exact searches
+def _build_nearest_neighbors(parameters, prefix, exact_class, approximate_class):
+    n_neighbors = int(parameters.get(prefix + '_k') or 5)
+    weights = parameters.get(prefix + '_weights') or 'uniform'
+    algorithm = parameters.get(prefix + '_algorithm') or 'auto'
+
+    if algorithm == 'ivf':
+        n_lists = parameters.get(prefix + '_n_lists')
+        return approximate_class(n_neighbors=n_neighbors,
+                                 weights=weights,
+                                 n_lists=int(n_lists) if n_lists else None,
+                                 n_probe=int(parameters.get(prefix + '_n_probe') or ANN_DEFAULT_PROBES))
+
+    p = int(parameters.get(prefix + '_p') or 2)
+    return exact_class(n_neighbors=n_neighbors,
+                       algorithm=algorithm,
+                       weights=weights,
+                       p=p)
 
-    neighbors = KNeighborsClassifier(n_neighbors=n_neighbors,
-                                     algorithm=algorithm,
-                                     weights=weights,
-                                     p=p)
 
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-    clf_test = neighbors.fit(x_train, y_train)
-    acc = get_match_acc(clf_test.predict(x_test), y_test)
+def create_k_nearest_neighbors_classifier(data, parameters, final_fit=True):
+    neighbors = _build_nearest_neighbors(parameters, 'nnc', KNeighborsClassifier, IVFNeighborsClassifier)
+
+    clf_test = neighbors.fit(data.x_train, data.y_train)
+    acc = get_match_acc(clf_test.predict(data.x_test), data.y_test)
     parameters['accuracy'] = acc
     parameters['accuracy_type'] = 'Accuracy [%]'
 
-    neighbors.fit(input_df, target_df)
+    if final_fit:
+        neighbors.fit(data.x, data.y)
 
     return neighbors
 
 
-def create_k_nearest_neighbors_regressor(input_df, target_df, parameters):
-    n_neighbors = int(parameters.get('nnc_k', 5))
-    weights = parameters.get('weights', 'uniform')
-    algorithm = parameters.get('algorithm', 'auto')
-    p = int(parameters.get('nnc_p', 2))
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-
-    neighbors = KNeighborsRegressor(n_neighbors=n_neighbors,
-                                    algorithm=algorithm,
-                                    weights=weights,
-                                    p=p)
+def create_k_nearest_neighbors_regressor(data, parameters, final_fit=True):
+    neighbors = _build_nearest_neighbors(parameters, 'nnr', KNeighborsRegressor, IVFNeighborsRegressor)
 
-    regr_test = neighbors.fit(x_train, y_train)
-    score = round(regr_test.score(x_test, y_test), 4)
+    regr_test = neighbors.fit(data.x_train, data.y_train)
+    score = round(regr_test.score(data.x_test, data.y_test), 4)
     parameters['accuracy'] = score
     parameters['accuracy_type'] = 'R^2'
 
-    neighbors.fit(input_df, target_df)
+    if final_fit:
+        neighbors.fit(data.x, data.y)
 
     return neighbors
 
 
-def create_nearest_centroid(input_df, target_df, parameters):
+def create_nearest_centroid(data, parameters, final_fit=True):
     clf = NearestCentroid()
 
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-    clf_test = clf.fit(x_train, y_train)
-    acc = get_match_acc(clf_test.predict(x_test), y_test)
+    clf_test = clf.fit(data.x_train, data.y_train)
+    acc = get_match_acc(clf_test.predict(data.x_test), data.y_test)
     parameters['accuracy'] = acc
     parameters['accuracy_type'] = 'Accuracy [%]'
 
-    clf.fit(input_df, target_df)
+    if final_fit:
+        clf.fit(data.x, data.y)
 
     return clf
 
 
-def create_support_vector_machine_classifier(input_df, target_df, parameters):
+def create_support_vector_machine_classifier(data, parameters, final_fit=True):
     kernel = parameters.get('svc_kernel', 'rbf')
     degree = int(parameters.get('svc_degree', 3))
     c = parameters.get('svc_C', 1.0)
 
     clf = svm.SVC(kernel=kernel, degree=degree, C=c)
 
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-    clf_test = clf.fit(x_train, y_train)
-    acc = get_match_acc(clf_test.predict(x_test), y_test)
+    clf_test = clf.fit(data.x_train, data.y_train)
+    acc = get_match_acc(clf_test.predict(data.x_test), data.y_test)
     parameters['accuracy'] = acc
     parameters['accuracy_type'] = 'Accuracy [%]'
 
-    clf.fit(input_df, target_df)
+    if final_fit:
+        clf.fit(data.x, data.y)
 
     return clf
 
 
-def create_support_vector_machine_regressor(input_df, target_df, parameters):
+def create_support_vector_machine_regressor(data, parameters, final_fit=True):
     kernel = parameters.get('svr_kernel', 'rbf')
     degree = int(parameters.get('svr_degree', 3))
 
     svm_reg = svm.SVR(kernel=kernel, degree=degree)
 
-    x_train, x_test, y_train, y_test = train_test_split(input_df, target_df)
-    regr_test = svm_reg.fit(x_train, y_train)
-    score = round(regr_test.score(x_test, y_test), 4)
+    regr_test = svm_reg.fit(data.x_train, data.y_train)
+    score = round(regr_test.score(data.x_test, data.y_test), 4)
     parameters['accuracy'] = score
     parameters['accuracy_type'] = 'R^2'
 
-    svm_reg.fit(input_df, target_df)
+    if final_fit:
+        svm_reg.fit(data.x, data.y)
 
     return svm_reg
 
+
+ALGORITHM_BUILDERS = {
+    ALGORITHM.LINEAR_REGRESSION: create_linear_regression_model,
+    ALGORITHM.LOGISTIC_REGRESSION: create_logistic_regression_model,
+    ALGORITHM.LINEAR_DISCRIMINANT_ANALYSIS: create_linear_discriminant_analysis,
+    ALGORITHM.DECISION_TREE_REGRESSOR: create_decision_tree_regressor,
+    ALGORITHM.GAUSSIAN_NAIVE_BAYES: create_gaussian_naive_bayes,
+    ALGORITHM.RANDOM_FOREST_CLASSIFIER: create_random_forest_classifier,
+    ALGORITHM.RANDOM_FOREST_REGRESSOR: create_random_forest_regressor,
+    ALGORITHM.K_NEAREST_NEIGHBORS_CLASSIFIER: create_k_nearest_neighbors_classifier,
+    ALGORITHM.K_NEAREST_NEIGHBORS_REGRESSOR: create_k_nearest_neighbors_regressor,
+    ALGORITHM.SUPPORT_VECTOR_MACHINE_CLASSIFIER: create_support_vector_machine_classifier,
+    ALGORITHM.SUPPORT_VECTOR_MACHINE_REGRESSOR: create_support_vector_machine_regressor,
+    ALGORITHM.NEAREST_CENTROID: create_nearest_centroid,
+}
@@ -0,0 +1,117 @@
+import sys
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from django.conf import settings
+
+from .artifact_store import load_serving_model
+
+_SCALAR_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+# Approximates the in-memory size of a fitted estimator by walking its
+# attributes and summing array buffers. Cython objects such as sklearn trees
+# expose their arrays through __getstate__.
+def estimate_model_size(obj, _seen=None):
+    if _seen is None:
+        _seen = set()
+
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+
+    if isinstance(obj, _SCALAR_TYPES):
+        return sys.getsizeof(obj)
+
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_model_size(item, _seen) for item in obj)
+
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_model_size(key, _seen) + estimate_model_size(value, _seen)
+                                        for key, value in obj.items())
+
+    state = getattr(obj, '__dict__', None)
+    if state is None and hasattr(obj, '__getstate__'):
+        try:
+            state = obj.__getstate__()
+        except Exception:
+            state = None
+
+    size = sys.getsizeof(obj)
+    if state is not None:
+        size += estimate_model_size(state, _seen)
+
+    return size
+
+
+class ModelCache:
+    """Least-recently-used cache of unpickled estimators for one process.
+
+    Entries are evicted when either the entry count or the estimated total
+    size goes over its limit.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, model, size):
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+            self._entries[key] = (model, size)
+            self.total_bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                evicted_key, (evicted_model, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def invalidate(self, model_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == model_id]:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+model_cache = ModelCache(settings.EASYML_MODEL_CACHE_ENTRIES, settings.EASYML_MODEL_CACHE_BYTES)
+
+
+# Returns the estimator (or its compact form) for an MLModel, only loading it
+# from the artifact store (or the legacy data column) on a cache miss. Callers
+# should load model_obj with defer('data').
+def get_cached_model(model_obj):
+    key = (model_obj.id, model_obj.created_at)
+    model = model_cache.get(key)
+    if model is None:
+        model = load_serving_model(model_obj)
+        model_cache.put(key, model, estimate_model_size(model))
+
+    return model
+
+
+def invalidate_model(model_id):
+    model_cache.invalidate(int(model_id))
@@ -1,56 +1,87 @@
 import json
-import pandas as pd
-import numpy as np
-import traceback
-import msgpack
-import math
-import pickle
-import base64
-
-from sklearn.model_selection import train_test_split, GridSearchCV
-from sklearn.linear_model import LogisticRegression, LinearRegression
-from sklearn.neighbors import NearestNeighbors
-from sklearn.neighbors.nearest_centroid import NearestCentroid
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
-from sklearn.model_selection import cross_val_score
-from sklearn.tree import DecisionTreeRegressor
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.naive_bayes import GaussianNB
-from sklearn import svm
-
-from django.utils.encoding import smart_bytes
-from .constants import COLUMN_TYPE, ALGORITHM, ALGORITHM_NAME_MAP
-from mainsite.models import CsvFile, CsvFileData, MLModel
-from .util import get_dataframe, get_itos_map
-
-
-def run_model_predict(file_obj, model_obj):
-
-    file_data = CsvFileData.objects.filter(parent_file=file_obj)\
-        .exclude(type=COLUMN_TYPE.IGNORE).order_by('column_num')
 
-    model_parent_file_id = model_obj.parent_file_id
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connections
+from .constants import COLUMN_TYPE, PREDICT_CHUNK_ROWS
+from .categories import get_column_decoders
+from .model_cache import get_cached_model
+from .util import get_file_headers, iter_file_blocks
+
+
+# Returns the input headers (in training order) and target header of a model.
+# Models trained before these were recorded use the parent file's column types.
+def get_model_columns(model_obj):
+    parameters = json.loads(model_obj.parameters)
+    if 'input_columns' in parameters:
+        return parameters['input_columns'], parameters['target_column']
+
+    parent_file_id = model_obj.parent_file_id
+    target_headers = get_file_headers(parent_file_id, COLUMN_TYPE.TARGET)
+
+    return get_file_headers(parent_file_id, COLUMN_TYPE.INPUT), target_headers[0] if target_headers else None
+
+
+# Holds the model for block prediction workers, set once per worker process
+_predict_worker_model = {}
+
+
+def _init_predict_worker(model):
+    _predict_worker_model['model'] = model
 
-    if file_data.count() == 0:
-        print("Error: No data for file {}".format(file_obj.display_name))
+
+def _predict_block(matrix):
+    return _predict_worker_model['model'].predict(matrix)
+
+
+# Yields (block_df, predictions) in block order. With more than one worker the
+# blocks are scored on a process pool, with at most two blocks per worker in
+# flight so memory stays bounded.
+def iter_block_predictions(model, blocks, n_workers=1):
+    if n_workers <= 1:
+        for block_df in blocks:
+            yield block_df, model.predict(block_df.values)
         return
 
-    input_data = file_data.filter(type=COLUMN_TYPE.INPUT).order_by('column_num')
-    target_col = file_data.filter(type=COLUMN_TYPE.TARGET).first().column_header
+    # Forked workers must not share the parent's database connection
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=n_workers,
+                             initializer=_init_predict_worker,
+                             initargs=(model,)) as executor:
+        pending = deque()
+        for block_df in blocks:
+            pending.append((block_df, executor.submit(_predict_block, block_df.values)))
+            if len(pending) >= n_workers * 2:
+                block_df, future = pending.popleft()
+                yield block_df, future.result()
+
+        while pending:
+            block_df, future = pending.popleft()
+            yield block_df, future.result()
+
+
+# Predicts the target for a file in blocks of chunk_rows rows and yields each
+# block as a frame of the input columns plus the decoded target column
+def iter_model_predict(file_obj, model_obj, chunk_rows=PREDICT_CHUNK_ROWS):
+    model_parent_file_id = model_obj.parent_file_id
+
+    target_headers = get_file_headers(file_obj.id, COLUMN_TYPE.TARGET)
+    if not target_headers:
+        raise ValueError("No target column for file {}".format(file_obj.display_name))
 
-    model = model_obj.data
-    input_df = get_dataframe(input_data)
+    target_col = target_headers[0]
 
-    results = pd.DataFrame(model.predict(input_df), columns=[target_col])
+    model = get_cached_model(model_obj)
+    decoders = get_column_decoders(model_parent_file_id)
 
-    concat_df = pd.concat([input_df, results], axis=1)
+    blocks = iter_file_blocks(file_obj.id, COLUMN_TYPE.INPUT, chunk_rows)
+    for block_df, predictions in iter_block_predictions(model, blocks, settings.EASYML_PREDICT_WORKERS):
+        chunk_df = block_df.copy()
+        chunk_df[target_col] = predictions
 
-    csv_itos_map = get_itos_map(model_parent_file_id)
-    for header in csv_itos_map:
-        for datapoint in csv_itos_map[header]:
-            concat_df[header] = concat_df[header].replace(to_replace=datapoint, value=csv_itos_map[header][datapoint])
+        for header, decoder in decoders.items():
+            if header in chunk_df:
+                chunk_df[header] = decoder.decode(chunk_df[header].values)
 
-    csv_data = concat_df.to_csv()
-    return csv_data, concat_df
+        yield chunk_df
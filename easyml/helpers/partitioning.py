@@ -0,0 +1,169 @@
+import threading
+
+from django.db import connection
+
+from mainsite.models import CsvFileData
+
+# Needs Postgres 11 or later (partitioned primary keys, foreign keys and
+# default partitions)
+PARTITION_LIST = 'list'
+PARTITION_HASH = 'hash'
+
+PARTITION_STRATEGY_SQL = """
+    SELECT p.partstrat FROM pg_partitioned_table p
+    WHERE p.partrelid = to_regclass(%s)
+"""
+
+TABLE_INDEXES_SQL = """
+    SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+    WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary
+"""
+
+TABLE_FOREIGN_KEYS_SQL = """
+    SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+    WHERE conrelid = to_regclass(%s) AND contype = 'f'
+"""
+
+_strategy = None
+_strategy_lock = threading.Lock()
+
+
+def cell_table():
+    return CsvFileData._meta.db_table
+
+
+def file_partition_name(file_id):
+    return '{}_f{}'.format(cell_table(), int(file_id))
+
+
+def _query_strategy(conn):
+    if conn.vendor != 'postgresql':
+        return None
+
+    with conn.cursor() as cursor:
+        cursor.execute(PARTITION_STRATEGY_SQL, [cell_table()])
+        row = cursor.fetchone()
+
+    return {'l': PARTITION_LIST, 'h': PARTITION_HASH}.get(row[0]) if row else None
+
+
+# The partitioning the cell table actually has, looked up once per process
+def get_partition_strategy():
+    global _strategy
+
+    with _strategy_lock:
+        if _strategy is None:
+            _strategy = _query_strategy(connection) or ''
+
+    return _strategy or None
+
+
+# The table that a file's cells are written to. With list partitioning each
+# file has its own partition, so bulk loads skip the routing step.
+def get_file_data_table(file_id):
+    if get_partition_strategy() == PARTITION_LIST:
+        return file_partition_name(file_id)
+
+    return cell_table()
+
+
+def create_file_partition(file_id):
+    if get_partition_strategy() != PARTITION_LIST:
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({})".format(
+            connection.ops.quote_name(file_partition_name(file_id)),
+            connection.ops.quote_name(cell_table()),
+            int(file_id)))
+
+    return True
+
+
+# Drops a file's partition, which removes all of its cells at once. Returns
+# False when the cells have to be deleted row by row instead.
+def drop_file_partition(file_id):
+    if get_partition_strategy() != PARTITION_LIST:
+        return False
+
+    partition = connection.ops.quote_name(file_partition_name(file_id))
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [file_partition_name(file_id)])
+        if cursor.fetchone()[0] is None:
+            return False
+
+        cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(connection.ops.quote_name(cell_table()), partition))
+        cursor.execute("DROP TABLE {}".format(partition))
+
+    return True
+
+
+# Recreates the cell table with the given PARTITION BY clause (or none),
+# moving every row, index and foreign key across. Used by migrations.
+def _rebuild_cell_table(conn, partition_clause, primary_key, create_partitions):
+    qn = conn.ops.quote_name
+    table = cell_table()
+    old_table = table + '_old'
+
+    with conn.cursor() as cursor:
+        cursor.execute(TABLE_INDEXES_SQL, [table])
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(TABLE_FOREIGN_KEYS_SQL, [table])
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute("ALTER TABLE {} RENAME TO {}".format(qn(table), qn(old_table)))
+        cursor.execute("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) {}".format(
+            qn(table), qn(old_table), partition_clause))
+
+        create_partitions(cursor, old_table)
+
+        cursor.execute("INSERT INTO {} SELECT * FROM {}".format(qn(table), qn(old_table)))
+        if sequence:
+            cursor.execute("ALTER SEQUENCE {} OWNED BY {}.id".format(sequence, qn(table)))
+
+        # The old table keeps the index and key names until it is dropped
+        cursor.execute("DROP TABLE {} CASCADE".format(qn(old_table)))
+        cursor.execute("ALTER TABLE {} ADD PRIMARY KEY ({})".format(qn(table), primary_key))
+
+        for index_def in index_defs:
+            # Indexes of a partitioned table are defined ON ONLY the parent
+            cursor.execute(index_def.replace(' ON ONLY ', ' ON ', 1))
+        for name, definition in foreign_keys:
+            cursor.execute("ALTER TABLE {} ADD CONSTRAINT {} {}".format(qn(table), qn(name), definition))
+
+
+def partition_cell_table(conn, strategy, hash_partitions):
+    if conn.vendor != 'postgresql' or strategy not in (PARTITION_LIST, PARTITION_HASH):
+        return
+
+    if _query_strategy(conn):
+        return
+
+    qn = conn.ops.quote_name
+    table = cell_table()
+
+    def create_partitions(cursor, old_table):
+        if strategy == PARTITION_HASH:
+            for remainder in range(hash_partitions):
+                cursor.execute("CREATE TABLE {} PARTITION OF {} FOR VALUES WITH (MODULUS {}, REMAINDER {})".format(
+                    qn('{}_h{}'.format(table, remainder)), qn(table), hash_partitions, remainder))
+            return
+
+        # Catches the cells of any file that has no partition of its own
+        cursor.execute("CREATE TABLE {} PARTITION OF {} DEFAULT".format(qn(table + '_default'), qn(table)))
+        cursor.execute("SELECT DISTINCT parent_file_id FROM {}".format(qn(old_table)))
+        for (file_id,) in cursor.fetchall():
+            cursor.execute("CREATE TABLE {} PARTITION OF {} FOR VALUES IN ({})".format(
+                qn(file_partition_name(file_id)), qn(table), int(file_id)))
+
+    partition_clause = "PARTITION BY {} (parent_file_id)".format(strategy.upper())
+    _rebuild_cell_table(conn, partition_clause, 'id, parent_file_id', create_partitions)
+
+
+def unpartition_cell_table(conn):
+    if not _query_strategy(conn):
+        return
+
+    _rebuild_cell_table(conn, '', 'id', lambda cursor, old_table: None)
@@ -0,0 +1,133 @@
+import io
+import threading
+import traceback
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, connection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .constants import PLOT_FEATURE_CAP, PLOT_SAMPLE_ROWS, PLOT_SAMPLE_SEED
+from .util import get_file_headers, get_file_row_count, get_file_rows
+from mainsite.models import CsvFilePlot
+
+PLOT_CONTENT_TYPE = 'image/png'
+
+_plot_executor = None
+_plot_pending = set()
+_plot_lock = threading.Lock()
+
+
+# Positions of at most sample_rows of n_rows rows, picked with a fixed seed
+# so a file always renders the same plot
+def sample_plot_positions(n_rows, sample_rows=PLOT_SAMPLE_ROWS):
+    if n_rows <= sample_rows:
+        return np.arange(n_rows)
+
+    rng = np.random.RandomState(PLOT_SAMPLE_SEED)
+    return np.sort(rng.choice(n_rows, sample_rows, replace=False))
+
+
+# Draws histograms on the diagonal and pairwise scatters elsewhere, using a
+# standalone Figure so nothing touches pyplot's global state
+def render_scatter_matrix(data_df):
+    headers = list(data_df.columns)
+    n = len(headers)
+    values = data_df.values.astype(np.float64)
+
+    fig = Figure(figsize=(max(6, 1.5 * n), max(6, 1.5 * n)))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(n, n, squeeze=False)
+
+    for i in range(n):
+        for j in range(n):
+            ax = axes[i, j]
+            if i == j:
+                column = values[:, i]
+                ax.hist(column[np.isfinite(column)])
+            else:
+                present = np.isfinite(values[:, i]) & np.isfinite(values[:, j])
+                ax.scatter(values[present, j], values[present, i], s=4, alpha=0.5)
+
+            ax.set_xlabel(headers[j] if i == n - 1 else '')
+            ax.set_ylabel(headers[i] if j == 0 else '')
+            if i != n - 1:
+                ax.set_xticklabels([])
+            if j != 0:
+                ax.set_yticklabels([])
+
+    fig.subplots_adjust(bottom=0.15, wspace=0, hspace=0)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+
+    return buf.getvalue()
+
+
+def plot_allowed(headers):
+    return 0 < len(headers) <= PLOT_FEATURE_CAP
+
+
+# Checks the headers before reading any rows, then reads only the sample
+def build_file_plot(file_id):
+    if not plot_allowed(get_file_headers(file_id)):
+        return None
+
+    data_df = get_file_rows(file_id, sample_plot_positions(get_file_row_count(file_id)))
+    image = render_scatter_matrix(data_df)
+
+    try:
+        plot, created = CsvFilePlot.objects.get_or_create(parent_file_id=file_id,
+                                                          defaults={'image': image, 'sample_rows': len(data_df)})
+    except IntegrityError:
+        # The file was deleted while its plot was being drawn
+        return None
+
+    return plot
+
+
+def get_file_plot(file_id):
+    return CsvFilePlot.objects.filter(parent_file_id=file_id).first()
+
+
+# Drops the stored plot of a file whose rows changed and queues a new one
+def refresh_file_plot(file_id):
+    CsvFilePlot.objects.filter(parent_file_id=file_id).delete()
+    schedule_file_plot(file_id)
+
+
+def _render_in_background(file_id):
+    try:
+        build_file_plot(file_id)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        with _plot_lock:
+            _plot_pending.discard(file_id)
+        connection.close()
+
+
+# Queues the plot of a file for rendering on a background thread. Returns
+# False if it is already queued.
+def schedule_file_plot(file_id):
+    global _plot_executor
+
+    with _plot_lock:
+        if file_id in _plot_pending:
+            return False
+
+        if _plot_executor is None:
+            _plot_executor = ThreadPoolExecutor(max_workers=settings.EASYML_PLOT_WORKERS)
+
+        _plot_pending.add(file_id)
+
+    _plot_executor.submit(_render_in_background, file_id)
+    return True
+
+
+def plot_pending(file_id):
+    with _plot_lock:
+        return file_id in _plot_pending
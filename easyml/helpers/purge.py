@@ -0,0 +1,106 @@
+import traceback
+
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .artifact_store import delete_model_artifact
+from .constants import JOB_STALE_SECONDS, JOB_STATUS, PURGE_BATCH_ROWS
+from .partitioning import drop_file_partition
+from mainsite.models import (
+    CsvFile,
+    CsvFileCategory,
+    CsvFileColumn,
+    CsvFileData,
+    CsvFilePlot,
+    MLModel,
+    TrainingJob,
+)
+
+# Tables holding rows of a file, in the order they are purged
+PURGE_MODELS = [CsvFileData, CsvFileColumn, CsvFileCategory, CsvFilePlot, TrainingJob, MLModel]
+
+BATCH_DELETE_SQL = """
+    DELETE FROM {table} WHERE parent_file_id = %s AND id IN (
+        SELECT id FROM {table} WHERE parent_file_id = %s LIMIT %s
+    )
+"""
+
+
+# Hides the file straight away and stops its training jobs. The display name
+# is freed so the user can reuse it before the purge has run.
+def soft_delete_file(file_obj):
+    now = timezone.now()
+    with transaction.atomic():
+        CsvFile.all_objects.filter(id=file_obj.id)\
+            .update(deleted_at=now, display_name='__deleted__{}'.format(file_obj.id))
+
+        TrainingJob.objects.filter(parent_file_id=file_obj.id, status=JOB_STATUS.QUEUED)\
+            .update(status=JOB_STATUS.CANCELLED, finished_at=now)
+        TrainingJob.objects.filter(parent_file_id=file_obj.id, status=JOB_STATUS.RUNNING)\
+            .update(cancel_requested=True)
+
+    file_obj.deleted_at = now
+
+
+# Deletes the rows of one table belonging to a file, batch_rows at a time so
+# no single statement holds locks on millions of rows
+def delete_file_rows(model, file_id, batch_rows=PURGE_BATCH_ROWS):
+    sql = BATCH_DELETE_SQL.format(table=connection.ops.quote_name(model._meta.db_table))
+
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [file_id, file_id, batch_rows])
+                count = cursor.rowcount
+
+        deleted += count
+        if count < batch_rows:
+            return deleted
+
+
+def purge_file(file_id, batch_rows=PURGE_BATCH_ROWS):
+    for model_obj in MLModel.objects.filter(parent_file_id=file_id).defer('data'):
+        delete_model_artifact(model_obj)
+
+    # Versions of a model may fall in different delete batches
+    MLModel.objects.filter(parent_file_id=file_id).update(previous_version=None)
+
+    for model in PURGE_MODELS:
+        if model is CsvFileData and drop_file_partition(file_id):
+            continue
+
+        delete_file_rows(model, file_id, batch_rows)
+
+    CsvFile.all_objects.filter(id=file_id).delete()
+
+
+# Purges every soft-deleted file, oldest first. Files with a training job
+# still running are left until the job has seen its cancellation; jobs
+# whose heartbeat has gone stale do not hold the file back.
+# Returns the number purged.
+def purge_deleted_files(limit=None, batch_rows=PURGE_BATCH_ROWS):
+    cutoff = timezone.now() - timedelta(seconds=JOB_STALE_SECONDS)
+    running = TrainingJob.objects.filter(status=JOB_STATUS.RUNNING)\
+        .filter(Q(heartbeat_at__gte=cutoff) | Q(heartbeat_at=None, started_at__gte=cutoff))\
+        .values('parent_file_id')
+    file_ids = CsvFile.all_objects.exclude(deleted_at=None)\
+        .exclude(id__in=running)\
+        .order_by('deleted_at')\
+        .values_list('id', flat=True)
+    if limit:
+        file_ids = file_ids[:limit]
+
+    purged = 0
+    for file_id in list(file_ids):
+        try:
+            purge_file(file_id, batch_rows)
+        except Exception:
+            traceback.print_exc()
+            continue
+
+        purged += 1
+
+    return purged
@@ -0,0 +1,69 @@
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+CSV_CONTENT_TYPE = 'text/csv'
+PARQUET_CONTENT_TYPE = 'application/octet-stream'
+
+
+def parquet_available():
+    return pq is not None
+
+
+# Yields the CSV text of each frame, with the header only on the first one
+def iter_csv_chunks(chunks):
+    header = True
+    for chunk_df in chunks:
+        buf = io.StringIO()
+        chunk_df.to_csv(buf, header=header)
+        header = False
+        yield buf.getvalue()
+
+
+class _DrainableBuffer(io.RawIOBase):
+    """Write-only sink whose contents can be taken out between writes."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Yields a Parquet file one row group per frame. Object columns are written as
+# strings so every frame shares the first frame's schema.
+def iter_parquet_chunks(chunks):
+    sink = _DrainableBuffer()
+    writer = None
+    schema = None
+    for chunk_df in chunks:
+        chunk_df = chunk_df.copy()
+        for header in chunk_df.columns:
+            if chunk_df[header].dtype == object:
+                chunk_df[header] = chunk_df[header].where(chunk_df[header].isna(), chunk_df[header].astype(str))
+
+        table = pa.Table.from_pandas(chunk_df, schema=schema, preserve_index=False)
+        if writer is None:
+            schema = table.schema
+            writer = pq.ParquetWriter(sink, schema)
+
+        writer.write_table(table)
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
@@ -0,0 +1,108 @@
+import math
+import numpy as np
+
+from .constants import (
+    SAMPLE_MIN_ROWS,
+    SAMPLE_PROGRESSIVE_GROWTH,
+    SAMPLE_PROGRESSIVE_START,
+    SAMPLE_PROGRESSIVE_TOL,
+    SAMPLE_SEED,
+)
+
+SAMPLE_NONE = 'none'
+SAMPLE_SIZE = 'size'
+SAMPLE_FRACTION = 'fraction'
+SAMPLE_PROGRESSIVE = 'progressive'
+
+
+# A random order of the rows in which every prefix is a uniform sample, so
+# growing samples are nested
+def random_order(n_rows, random_state=SAMPLE_SEED):
+    return np.random.RandomState(random_state).permutation(n_rows)
+
+
+# A random order of the rows in which every prefix holds each class in
+# proportion to its share of the rows. The first row of every class comes
+# first, so rare classes are never left out of a sample.
+def stratified_order(y, random_state=SAMPLE_SEED):
+    rng = np.random.RandomState(random_state)
+    classes, class_index, class_counts = np.unique(y, return_inverse=True, return_counts=True)
+
+    keys = np.empty(len(y))
+    for class_num in range(len(classes)):
+        rows = np.flatnonzero(class_index == class_num)
+        ranks = rng.permutation(len(rows)).astype(np.float64)
+        keys[rows] = (ranks + rng.random_sample(len(rows))) / len(rows)
+        keys[rows[ranks == 0]] -= 1
+
+    return np.argsort(keys, kind='mergesort')
+
+
+def _score_gain(score, previous, accuracy_type):
+    gain = score - previous
+    if accuracy_type != 'R^2':
+        gain /= 100.0
+
+    return gain
+
+
+def _sample_limit(parameters, n_rows):
+    mode = parameters.get('sample_mode') or SAMPLE_NONE
+    if mode in (SAMPLE_SIZE, SAMPLE_PROGRESSIVE) and parameters.get('sample_size'):
+        return int(parameters['sample_size'])
+
+    if mode == SAMPLE_FRACTION and parameters.get('sample_fraction'):
+        return int(math.ceil(n_rows * float(parameters['sample_fraction'])))
+
+    return n_rows
+
+
+def get_sample_rows(y, parameters, stratify, score_rows=None):
+    """Returns the sorted indices of the rows to train on, or None for all.
+
+    sample_mode 'size' and 'fraction' draw a fixed sample. 'progressive'
+    starts from SAMPLE_PROGRESSIVE_START rows and grows the sample until
+    score_rows(rows) improves by less than SAMPLE_PROGRESSIVE_TOL or the
+    sample_size cap (or every row) is reached. Classification targets are
+    sampled by class, anything else uniformly. The sample used is recorded
+    in parameters['sample'].
+    """
+    parameters.pop('sample', None)
+    mode = parameters.get('sample_mode') or SAMPLE_NONE
+    n_rows = len(y)
+    limit = min(n_rows, max(SAMPLE_MIN_ROWS, _sample_limit(parameters, n_rows)))
+    if mode == SAMPLE_NONE or (mode != SAMPLE_PROGRESSIVE and limit >= n_rows):
+        return None
+
+    order = stratified_order(y) if stratify else random_order(n_rows)
+    sample = {
+        'mode': mode,
+        'stratified': bool(stratify),
+        'seed': SAMPLE_SEED,
+        'total_rows': n_rows,
+    }
+
+    size = limit
+    if mode == SAMPLE_PROGRESSIVE:
+        steps = []
+        size = min(limit, max(SAMPLE_MIN_ROWS, SAMPLE_PROGRESSIVE_START))
+        previous = None
+        while True:
+            score, accuracy_type = score_rows(np.sort(order[:size]))
+            steps.append({'rows': size, 'score': score})
+
+            converged = previous is not None and _score_gain(score, previous, accuracy_type) < SAMPLE_PROGRESSIVE_TOL
+            if converged or size >= limit:
+                break
+
+            previous = score
+            size = min(limit, size * SAMPLE_PROGRESSIVE_GROWTH)
+
+        sample['steps'] = steps
+
+    sample['rows'] = size
+    parameters['sample'] = sample
+    if size >= n_rows:
+        return None
+
+    return np.sort(order[:size])
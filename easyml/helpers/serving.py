@@ -0,0 +1,214 @@
+import queue
+import threading
+import time
+import numpy as np
+
+from collections import OrderedDict
+from django.conf import settings
+
+from .categories import get_file_categories
+from .model_cache import get_cached_model
+from .model_predict import get_model_columns
+
+_STOP = object()
+
+
+class PredictionError(Exception):
+    pass
+
+
+class _PendingPrediction:
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class PredictionBatcher:
+    """Serves online predictions for one model.
+
+    Requests that arrive within max_wait seconds of each other are stacked
+    into a single model.predict call of at most max_batch_rows rows.
+    Category codes are looked up for every request, so values added to the
+    file since the batcher was built are known.
+    """
+
+    def __init__(self, model_obj, max_batch_rows, max_wait):
+        self.model_obj = model_obj
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self.input_columns, self.target_column = get_model_columns(model_obj)
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def encode_rows(self, rows, categories):
+        matrix = np.empty((len(rows), len(self.input_columns)), dtype=np.float64)
+        for col_index, header in enumerate(self.input_columns):
+            header_map = categories.stoi_map.get(header)
+            for row_index, row in enumerate(rows):
+                if isinstance(row, dict):
+                    if header not in row:
+                        raise PredictionError('Row {} is missing column "{}"'.format(row_index, header))
+                    value = row[header]
+                else:
+                    if len(row) != len(self.input_columns):
+                        raise PredictionError('Row {} has {} values, expected {}'
+                                              .format(row_index, len(row), len(self.input_columns)))
+                    value = row[col_index]
+
+                if header_map is not None and isinstance(value, str):
+                    if value not in header_map:
+                        raise PredictionError('Unknown value "{}" for column "{}"'.format(value, header))
+                    value = header_map[value]
+
+                try:
+                    matrix[row_index, col_index] = value
+                except (TypeError, ValueError):
+                    raise PredictionError('Invalid value {!r} for column "{}"'.format(value, header))
+
+        # NaN and infinity would fail the whole batch in predict, so they are
+        # rejected here, with only the request that sent them
+        finite = np.isfinite(matrix)
+        if not finite.all():
+            row_index, col_index = np.argwhere(~finite)[0]
+            raise PredictionError('Invalid value {!r} for column "{}" in row {}'
+                                  .format(matrix[row_index, col_index], self.input_columns[col_index], row_index))
+
+        return matrix
+
+    def decode_predictions(self, predictions, categories):
+        target_decoder = categories.decoders.get(self.target_column)
+        if target_decoder is None:
+            return predictions.tolist()
+
+        return target_decoder.decode(predictions).tolist()
+
+    def predict(self, rows):
+        categories = get_file_categories(self.model_obj.parent_file_id)
+        pending = _PendingPrediction(self.encode_rows(rows, categories))
+        with self._lock:
+            stopped = self._stopped
+            if not stopped:
+                self._queue.put(pending)
+
+        if stopped:
+            predictions = get_cached_model(self.model_obj).predict(pending.matrix)
+            return self.decode_predictions(predictions, categories)
+
+        pending.done.wait()
+
+        if pending.error:
+            raise pending.error
+
+        return self.decode_predictions(pending.result, categories)
+
+    # The stop marker is always the last item queued, so every request that
+    # made it into the queue is still answered
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._queue.put(_STOP)
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+
+        batch = [first]
+        batch_rows = len(first.matrix)
+        deadline = time.monotonic() + self.max_wait
+        while batch_rows < self.max_batch_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                pending = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if pending is _STOP:
+                self._queue.put(_STOP)
+                break
+
+            batch.append(pending)
+            batch_rows += len(pending.matrix)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+
+            try:
+                model = get_cached_model(self.model_obj)
+                predictions = model.predict(np.vstack([pending.matrix for pending in batch]))
+
+                offset = 0
+                for pending in batch:
+                    pending.result = predictions[offset:offset + len(pending.matrix)]
+                    offset += len(pending.matrix)
+
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0].error = e
+                else:
+                    self._predict_each(batch)
+
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    # After a batch fails, each request is predicted on its own, so only the
+    # requests that cause the failure get an error
+    def _predict_each(self, batch):
+        for pending in batch:
+            try:
+                pending.result = get_cached_model(self.model_obj).predict(pending.matrix)
+            except Exception as e:
+                pending.error = e
+
+
+_batchers = OrderedDict()
+_batchers_lock = threading.Lock()
+
+
+# Batchers are built outside the lock, since building one reads the
+# database. When two requests build the same batcher, the first one stored
+# is kept and the other is stopped.
+def get_batcher(model_obj):
+    key = (model_obj.id, model_obj.created_at)
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher:
+            _batchers.move_to_end(key)
+            return batcher
+
+    new_batcher = PredictionBatcher(model_obj,
+                                    settings.EASYML_PREDICT_BATCH_ROWS,
+                                    settings.EASYML_PREDICT_BATCH_WAIT)
+    with _batchers_lock:
+        batcher = _batchers.setdefault(key, new_batcher)
+        _batchers.move_to_end(key)
+
+        while len(_batchers) > settings.EASYML_MODEL_CACHE_ENTRIES:
+            _batchers.popitem(last=False)[1].stop()
+
+    if batcher is not new_batcher:
+        new_batcher.stop()
+
+    return batcher
+
+
+def drop_batcher(model_id):
+    with _batchers_lock:
+        for key in [key for key in _batchers if key[0] == model_id]:
+            _batchers.pop(key).stop()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from .constants import TRAINING_SPLIT_SEED, TRAINING_TEST_SIZE
+
+
+class TrainingData:
+    """The input and target rows of one training run, split once.
+
+    Rows are stored as a single contiguous float64 array, reordered so the
+    training rows come first. x_train and x_test are views into it, so the
+    split costs one copy of the data. The split is seeded, so every
+    candidate in Automatic mode is scored on the same rows. Standardized
+    copies and their fitted StandardScalers are computed on first use and
+    then shared.
+    """
+
+    def __init__(self, input_df, target, test_size=TRAINING_TEST_SIZE, random_state=TRAINING_SPLIT_SEED):
+        self.columns = list(input_df.columns)
+
+        target = np.asarray(target)
+        train_rows, test_rows = train_test_split(np.arange(len(target)),
+                                                 test_size=test_size,
+                                                 random_state=random_state)
+        order = np.concatenate([train_rows, test_rows])
+        self.n_train = len(train_rows)
+
+        self.x = np.ascontiguousarray(input_df.values[order], dtype=np.float64)
+        self.y = np.ascontiguousarray(target[order])
+
+        self._scalers = {}
+        self._scaled = {}
+
+    @property
+    def x_train(self):
+        return self.x[:self.n_train]
+
+    @property
+    def x_test(self):
+        return self.x[self.n_train:]
+
+    @property
+    def y_train(self):
+        return self.y[:self.n_train]
+
+    @property
+    def y_test(self):
+        return self.y[self.n_train:]
+
+    # Scaler fitted on the training rows (for scoring) or on every row (for
+    # the final fit)
+    def scaler(self, full=False):
+        if full not in self._scalers:
+            self._scalers[full] = StandardScaler().fit(self.x if full else self.x_train)
+
+        return self._scalers[full]
+
+    def scaled(self, full=False):
+        """Returns (x_train, x_test) standardized with the training scaler, or
+        every row standardized with the full scaler when full is True."""
+        if full not in self._scaled:
+            scaled = self.scaler(full).transform(self.x)
+            self._scaled[full] = scaled if full else (scaled[:self.n_train], scaled[self.n_train:])
+
+        return self._scaled[full]
+
+    # The cached standardized copies are rebuilt by the process that needs
+    # them rather than shipped to pool workers
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_scaled'] = {}
+        return state
@@ -0,0 +1,149 @@
+import math
+import numpy as np
+
+from django.conf import settings
+from joblib import Parallel, cpu_count, delayed
+from sklearn.base import clone
+from sklearn.model_selection import cross_val_score
+
+from .constants import TUNING_HALVING_FACTOR, TUNING_PLATEAU_TOL, TUNING_RANDOM_STATE
+
+# Set in worker processes that already run in parallel with each other, so
+# their own searches do not start another pool each
+_jobs_limit = None
+
+
+# Called before every round of a search; it raises to abandon the search,
+# e.g. when the training job running it is cancelled
+_checkpoint = None
+
+
+def limit_tuning_jobs(n_jobs):
+    global _jobs_limit
+    _jobs_limit = n_jobs
+
+
+def set_tuning_checkpoint(checkpoint):
+    global _checkpoint
+    _checkpoint = checkpoint
+
+
+def _check_cancelled():
+    if _checkpoint is not None:
+        _checkpoint()
+
+
+def get_tuning_jobs():
+    if _jobs_limit is not None:
+        return _jobs_limit
+
+    return settings.EASYML_TUNING_JOBS
+
+
+# Turns joblib's n_jobs convention (-1 = every core) into a worker count
+def _effective_jobs(n_jobs):
+    if n_jobs < 0:
+        return max(1, cpu_count() + 1 + n_jobs)
+
+    return max(1, n_jobs)
+
+
+def grown_depth(model):
+    if hasattr(model, 'estimators_'):
+        return max(tree.tree_.max_depth for tree in model.estimators_)
+
+    return model.tree_.max_depth
+
+
+# Fits a copy of the estimator and scores it on the held out rows, or by its
+# out-of-bag score when the estimator computes one
+def _fit_and_score(estimator, x_train, y_train, x_test, y_test):
+    model = clone(estimator).fit(x_train, y_train)
+    if getattr(model, 'oob_score', False):
+        score = model.oob_score_
+    else:
+        score = model.score(x_test, y_test)
+
+    return score, grown_depth(model)
+
+
+def search_depths(estimator, depths, x_train, y_train, x_test, y_test, n_jobs=None, tol=TUNING_PLATEAU_TOL):
+    """Returns (best_depth, scores) for a tree or forest over max_depth values.
+
+    Depths are fit in ascending waves of one depth per job. The sweep stops
+    after a wave once a tree stopped growing before its depth limit (deeper
+    limits would fit the same trees) or the best score improved by less than
+    tol. Ties go to the smallest depth.
+    """
+    n_jobs = _effective_jobs(get_tuning_jobs() if n_jobs is None else n_jobs)
+    depths = sorted(depths)
+    x_train, y_train = np.asarray(x_train), np.asarray(y_train)
+    x_test, y_test = np.asarray(x_test), np.asarray(y_test)
+
+    scores = {}
+    best_score = None
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for start in range(0, len(depths), n_jobs):
+            _check_cancelled()
+            wave = depths[start:start + n_jobs]
+            results = parallel(delayed(_fit_and_score)(clone(estimator).set_params(max_depth=depth),
+                                                       x_train, y_train, x_test, y_test)
+                               for depth in wave)
+
+            saturated = False
+            for depth, (score, depth_reached) in zip(wave, results):
+                scores[depth] = score
+                saturated = saturated or depth_reached < depth
+
+            wave_best = max(score for score, depth_reached in results)
+            plateaued = best_score is not None and wave_best - best_score < tol
+            if best_score is None or wave_best > best_score:
+                best_score = wave_best
+
+            if saturated or plateaued:
+                break
+
+    best_depth = max(scores, key=lambda depth: (scores[depth], -depth))
+    return best_depth, scores
+
+
+def _cv_score(estimator, x, y, cv):
+    scores = cross_val_score(estimator, x, y, cv=cv, error_score=np.nan)
+    if np.all(np.isnan(scores)):
+        return -np.inf
+
+    return float(np.nanmean(scores))
+
+
+def successive_halving(estimator, candidates, x, y, cv=5, factor=TUNING_HALVING_FACTOR, n_jobs=None):
+    """Returns (best_params, best_score) over a list of parameter dicts.
+
+    Every candidate is cross validated on a random subsample; the best
+    1/factor of them go on to a subsample factor times larger, until one is
+    left. The last round always uses every row.
+    """
+    n_jobs = get_tuning_jobs() if n_jobs is None else n_jobs
+    x, y = np.asarray(x), np.asarray(y)
+    if len(candidates) == 1:
+        return candidates[0], _cv_score(clone(estimator).set_params(**candidates[0]), x, y, cv)
+
+    n_rounds = max(1, int(math.ceil(math.log(len(candidates)) / math.log(factor))))
+    order = np.random.RandomState(TUNING_RANDOM_STATE).permutation(len(y))
+    min_rows = min(len(y), cv * len(np.unique(y)) * 2)
+
+    scored = [(params, None) for params in candidates]
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for round_num in range(n_rounds):
+            _check_cancelled()
+            n_rows = max(min_rows, int(len(y) / factor ** (n_rounds - 1 - round_num)))
+            rows = order[:n_rows]
+
+            scores = parallel(delayed(_cv_score)(clone(estimator).set_params(**params), x[rows], y[rows], cv)
+                              for params, score in scored)
+            scored = sorted(zip([params for params, score in scored], scores), key=lambda item: -item[1])
+            scored = scored[:max(1, int(math.ceil(len(scored) / factor)))]
+
+            if len(scored) == 1:
+                break
+
+    return scored[0]
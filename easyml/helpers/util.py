@@ -1,11 +1,18 @@
+import io
 import pandas as pd
 import numpy as np
 import traceback
 
 from .constants import COLUMN_TYPE, ALGORITHM
+# The metrics moved to helpers.metrics; they are re-exported here for the
+# callers that still import them from util
+from .metrics import get_match_acc, get_r2  # noqa: F401
 from mainsite.models import *
 from helpers.constants import *
 from django.contrib import messages
+from collections import OrderedDict
+from django.db.models import F, Max, Min, Sum
+from itertools import islice
 from operator import itemgetter
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext as _
@@ -38,19 +45,286 @@ def validate_password_strength(value1, value2):
     return True, ""
 
 
+def _batched(iterable, size):
+    batch = list(islice(iterable, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterable, size))
+
+
+# Pivots the cells of a CsvFileData queryset into a float64 frame with one
+# column per header (in column_num order) and one row per row_num.
+# All cells are fetched in a single streamed query.
 def get_dataframe(qry_data):
-    column_headers = qry_data.values_list('column_header', flat=True).distinct()
-    column_data = {}
-    for header in column_headers:
-        header_data = qry_data.filter(column_header=header).order_by('row_num')
-        column_data[header] = [d.data for d in header_data]
+    header_nums = qry_data.order_by('column_num')\
+        .values_list('column_num', 'column_header')\
+        .distinct()
+
+    column_nums = []
+    headers = []
+    for column_num, header in header_nums:
+        column_nums.append(column_num)
+        headers.append(header)
+
+    if not headers:
+        return pd.DataFrame()
+
+    row_range = qry_data.aggregate(row_min=Min('row_num'), row_max=Max('row_num'))
+    row_min = row_range['row_min']
+    n_rows = row_range['row_max'] - row_min + 1
+
+    column_nums = np.array(column_nums)
+    matrix = np.full((n_rows, len(headers)), np.nan, dtype=np.float64)
+    seen_rows = np.zeros(n_rows, dtype=bool)
+
+    cells = qry_data.order_by()\
+        .values_list('column_num', 'row_num', 'data')\
+        .iterator(chunk_size=DATA_LOAD_CHUNK_SIZE)
+
+    for batch in _batched(cells, DATA_LOAD_CHUNK_SIZE):
+        batch = np.array(batch, dtype=np.float64)
+        col_index = np.searchsorted(column_nums, batch[:, 0].astype(np.int64))
+        row_index = batch[:, 1].astype(np.int64) - row_min
+        matrix[row_index, col_index] = batch[:, 2]
+        seen_rows[row_index] = True
+
+    if not seen_rows.all():
+        matrix = matrix[seen_rows]
+
+    return pd.DataFrame(matrix, columns=headers)
+
+
+def column_to_blob(values):
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(values, dtype=np.float64), allow_pickle=False)
+    return buf.getvalue()
+
+
+def column_from_blob(blob):
+    return np.load(io.BytesIO(bytes(blob)), allow_pickle=False)
+
+
+# Stores one segment of a file's columns, starting at row row_start
+# column_values maps header -> (column_num, values)
+def save_file_columns(file_obj, column_values, segment=0, row_start=0, column_types=None):
+    column_types = column_types or {}
+    columns = []
+    for header, (column_num, values) in column_values.items():
+        values = np.asarray(values, dtype=np.float64)
+        columns.append(CsvFileColumn(parent_file=file_obj,
+                                     column_header=header,
+                                     column_num=column_num,
+                                     type=column_types.get(header),
+                                     segment=segment,
+                                     row_start=row_start,
+                                     num_rows=len(values),
+                                     data=column_to_blob(values)))
+
+    CsvFileColumn.objects.bulk_create(columns)
+
+
+# Concatenates the segments of each column in a CsvFileColumn queryset.
+# Returns {header: values} in column_num order.
+def load_file_columns(columns):
+    segments = OrderedDict()
+    rows = columns.order_by('column_num', 'segment').values_list('column_header', 'data')
+    for header, blob in rows.iterator():
+        segments.setdefault(header, []).append(column_from_blob(blob))
+
+    return OrderedDict((header, np.concatenate(parts)) for header, parts in segments.items())
+
+
+# Files stored before columnar storage count rows by their last row_num
+def get_file_row_count(file_id):
+    columns = CsvFileColumn.objects.filter(parent_file_id=file_id)
+    first_header = columns.order_by('column_num').values_list('column_header', flat=True).first()
+    if first_header is None:
+        row_max = CsvFileData.objects.filter(parent_file_id=file_id).aggregate(row_max=Max('row_num'))['row_max']
+        return 0 if row_max is None else row_max + 1
+
+    return columns.filter(column_header=first_header).aggregate(rows=Sum('num_rows'))['rows'] or 0
+
+
+def get_next_segment(file_id):
+    last_segment = CsvFileColumn.objects.filter(parent_file_id=file_id).aggregate(segment=Max('segment'))['segment']
+    return 0 if last_segment is None else last_segment + 1
+
+
+def has_file_columns(file_id):
+    return CsvFileColumn.objects.filter(parent_file_id=file_id).exists()
+
+
+def get_file_headers(file_id, column_type=None):
+    if has_file_columns(file_id):
+        columns = CsvFileColumn.objects.filter(parent_file_id=file_id)
+    else:
+        columns = CsvFileData.objects.filter(parent_file_id=file_id)
+
+    if column_type is not None:
+        columns = columns.filter(type=column_type)
+
+    headers = columns.order_by('column_num').values_list('column_header', 'column_num').distinct()
+    return [header for header, column_num in headers]
+
+
+# Loads a file's columns (optionally of a single type) in column_num order.
+# Files uploaded before columnar storage fall back to the per-cell rows.
+def get_file_dataframe(file_id, column_type=None):
+    if not has_file_columns(file_id):
+        file_data = CsvFileData.objects.filter(parent_file_id=file_id)
+        if column_type is not None:
+            file_data = file_data.filter(type=column_type)
+        return get_dataframe(file_data.order_by('column_num'))
+
+    columns = CsvFileColumn.objects.filter(parent_file_id=file_id)
+    if column_type is not None:
+        columns = columns.filter(type=column_type)
+
+    column_data = load_file_columns(columns)
+    return pd.DataFrame(column_data, columns=list(column_data))
+
+
+# Loads the named columns of a file in the given order, whatever their type
+def get_columns_dataframe(file_id, headers):
+    if not has_file_columns(file_id):
+        file_data = CsvFileData.objects.filter(parent_file_id=file_id, column_header__in=headers)
+        return get_dataframe(file_data.order_by('column_num'))[headers]
+
+    columns = CsvFileColumn.objects.filter(parent_file_id=file_id, column_header__in=headers)
+    return pd.DataFrame(load_file_columns(columns), columns=headers)
+
 
-    return pd.DataFrame.from_dict(column_data)
+# Re-blocks the column segments of a CsvFileColumn queryset into DataFrames
+# of block_rows rows. Only one segment's blobs are read at a time.
+def _iter_column_blocks(columns, block_rows):
+    segments = list(columns.order_by('segment').values_list('segment', flat=True).distinct())
+    pending = None
+    offset = 0
+    for segment in segments:
+        segment_df = pd.DataFrame(load_file_columns(columns.filter(segment=segment)))
+        pending = segment_df if pending is None else pd.concat([pending, segment_df], ignore_index=True)
+
+        while len(pending) >= block_rows or (segment == segments[-1] and len(pending)):
+            block_df = pending.iloc[:block_rows].reset_index(drop=True)
+            pending = pending.iloc[block_rows:]
+
+            block_df.index = pd.RangeIndex(offset, offset + len(block_df))
+            offset += len(block_df)
+            yield block_df
+
+
+# Yields a file's columns (optionally of a single type) in blocks of at most
+# block_rows rows, read segment by segment from the columnar copy. Files
+# uploaded before columnar storage are read by row_num range instead.
+def iter_file_blocks(file_id, column_type=None, block_rows=PREDICT_CHUNK_ROWS):
+    if has_file_columns(file_id):
+        columns = CsvFileColumn.objects.filter(parent_file_id=file_id)
+        if column_type is not None:
+            columns = columns.filter(type=column_type)
+
+        yield from _iter_column_blocks(columns, block_rows)
+        return
+
+    file_data = CsvFileData.objects.filter(parent_file_id=file_id)
+    if column_type is not None:
+        file_data = file_data.filter(type=column_type)
+
+    row_range = file_data.aggregate(row_min=Min('row_num'), row_max=Max('row_num'))
+    if row_range['row_min'] is None:
+        return
+
+    offset = 0
+    for start in range(row_range['row_min'], row_range['row_max'] + 1, block_rows):
+        block_df = get_dataframe(file_data.filter(row_num__gte=start, row_num__lt=start + block_rows))
+        if block_df.empty:
+            continue
+
+        block_df.index = pd.RangeIndex(offset, offset + len(block_df))
+        offset += len(block_df)
+        yield block_df
+
+
+# Loads the given rows (sorted positions) of a file's columns. Only the
+# segments holding one of the rows are read, one at a time.
+def get_file_rows(file_id, positions):
+    positions = np.asarray(positions, dtype=np.int64)
+    if not has_file_columns(file_id):
+        file_data = CsvFileData.objects.filter(parent_file_id=file_id, row_num__in=positions.tolist())
+        return get_dataframe(file_data)
+
+    columns = CsvFileColumn.objects.filter(parent_file_id=file_id)
+    segments = columns.order_by('segment').values_list('segment', 'row_start', 'num_rows').distinct()
+    blocks = []
+    for segment, row_start, num_rows in segments:
+        rows = positions[(positions >= row_start) & (positions < row_start + num_rows)] - row_start
+        if len(rows):
+            segment_df = pd.DataFrame(load_file_columns(columns.filter(segment=segment)))
+            blocks.append(segment_df.iloc[rows])
+
+    if not blocks:
+        return pd.DataFrame(columns=get_file_headers(file_id))
+
+    return pd.concat(blocks, ignore_index=True)
+
+
+def get_column_values(file_id, header):
+    column_data = load_file_columns(CsvFileColumn.objects.filter(parent_file_id=file_id, column_header=header))
+    if column_data:
+        return column_data[header]
+
+    header_data = CsvFileData.objects.filter(parent_file_id=file_id, column_header=header)\
+        .order_by('row_num')\
+        .values_list('data', flat=True)
+    return np.array(list(header_data), dtype=np.float64)
+
+
+# category_codes maps header -> {value: code}
+def save_file_categories(file_obj, category_codes):
+    categories = []
+    for header, codes in category_codes.items():
+        for value, code in codes.items():
+            categories.append(CsvFileCategory(parent_file=file_obj,
+                                              column_header=header,
+                                              code=int(code),
+                                              value=str(value)))
+
+    CsvFileCategory.objects.bulk_create(categories, batch_size=DATA_WRITE_CHUNK_SIZE)
+
+
+# 0 for deleted files, so nothing cached for the live file is served for them
+def get_file_version(file_id):
+    return CsvFile.objects.filter(id=file_id).values_list('data_version', flat=True).first() or 0
+
+
+def bump_file_version(file_id):
+    CsvFile.all_objects.filter(id=file_id).update(data_version=F('data_version') + 1)
+
+
+def get_categorical_headers(file_id):
+    return set(CsvFileCategory.objects.filter(parent_file_id=file_id).values_list('column_header', flat=True).distinct())
+
+
+# (header, code, value) for every category of a file, in code order.
+# Served from the (parent_file, column_header, code) unique index.
+def get_file_categories_qs(file_id, header=None):
+    categories = CsvFileCategory.objects.filter(parent_file_id=file_id)
+    if header is not None:
+        categories = categories.filter(column_header=header)
+
+    return categories.order_by('column_header', 'code').values_list('column_header', 'code', 'value')
 
 
 # Gets the map of data for a file to their placeholders
 # Int to String
+# Files stored with columnar data read the category table, older files
+# scan their placeholder cells
 def get_itos_map(file_id):
+    if has_file_columns(file_id):
+        itos_map = {}
+        for header, code, value in get_file_categories_qs(file_id):
+            itos_map.setdefault(header, {})[float(code)] = value
+        return itos_map
+
     file_obj = CsvFile.objects.get(id=file_id)
     placeholder_data = CsvFileData.objects.filter(parent_file=file_obj).exclude(placeholder=None)
 
@@ -69,6 +343,12 @@ def get_itos_map(file_id):
 # Gets the map of placeholders for a file to their data
 # String to Int
 def get_stoi_map(file_id):
+    if has_file_columns(file_id):
+        stoi_map = {}
+        for header, code, value in get_file_categories_qs(file_id):
+            stoi_map.setdefault(header, {})[value] = float(code)
+        return stoi_map
+
     file_obj = CsvFile.objects.get(id=file_id)
     placeholder_data = CsvFileData.objects.filter(parent_file=file_obj).exclude(placeholder=None)
 
@@ -98,8 +378,10 @@ def set_column_types(file_id, header_map):
         raise Exception("Only one target column is allowed")
 
     csv_data = CsvFileData.objects.filter(parent_file_id=file_id)
+    csv_columns = CsvFileColumn.objects.filter(parent_file_id=file_id)
     for header in header_map:
         csv_data.filter(column_header=header).update(type=header_map[header])
+        csv_columns.filter(column_header=header).update(type=header_map[header])
 
 
 def get_user_files(user):
@@ -108,7 +390,7 @@ def get_user_files(user):
 
 def get_user_models(user):
     user_files = get_user_files(user)
-    return MLModel.objects.filter(parent_file__in=user_files)
+    return MLModel.objects.filter(parent_file__in=user_files).defer('data')
 
 
 def get_alg_lst():
@@ -122,30 +404,5 @@ def get_alg_lst():
     return sorted(alg_lst, key=itemgetter('num'))
 
 
-def get_r2(y_pred, y_test):
-    n = len(y_test)
-    y_bar = sum(y_test) / n
-    ss_tot = 0
-    ss_res = 0
-    for i in range(n):
-        ss_tot += (y_test[i] - y_bar)**2
-        ss_res += (y_test[i] - y_pred[i])**2
-
-    return round(1 - (ss_res/ss_tot), 4)
-
-
-def get_match_acc(y_pred, y_test):
-    n = len(y_test)
-    if n == 0:
-        return 0
-
-    correct = 0
-    for i in range(n):
-        if y_pred[i] == y_test[i]:
-            correct += 1
-
-    return round((correct / n) * 100.0, 4)
-
-
 def to_percent(val, n=4):
     return round((val * 100), n)
@@ -0,0 +1,61 @@
+import time
+import numpy as np
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from helpers.baselines import per_column_dataframe
+from helpers.util import get_dataframe
+from mainsite.models import CsvFile, CsvFileData, CustomUser
+
+
+class Command(BaseCommand):
+    help = ('Times get_dataframe against the old per-column loader on the cells of a file. '
+            'Without --file-id a synthetic file is written and rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file-id', type=int, default=None,
+                            help='Benchmark the cells of an existing file')
+        parser.add_argument('--rows', type=int, default=20000)
+        parser.add_argument('--columns', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per loader; the fastest is reported')
+
+    def _time(self, load, qry_data, repeat):
+        best = None
+        for run in range(repeat):
+            start = time.perf_counter()
+            data_df = load(qry_data)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+
+        return data_df, best
+
+    def _benchmark(self, file_id, repeat):
+        qry_data = CsvFileData.objects.filter(parent_file_id=file_id)
+        new_df, new_seconds = self._time(get_dataframe, qry_data, repeat)
+        old_df, old_seconds = self._time(per_column_dataframe, qry_data, repeat)
+
+        same = np.allclose(new_df[old_df.columns].values, old_df.values, equal_nan=True)
+        self.stdout.write("{} cells: per-column loop {:.2f}s, get_dataframe {:.2f}s ({:.1f}x), frames {}".format(
+            qry_data.count(), old_seconds, new_seconds, old_seconds / new_seconds,
+            'match' if same else 'DIFFER'))
+
+    def handle(self, *args, **options):
+        if options['file_id']:
+            self._benchmark(options['file_id'], options['repeat'])
+            return
+
+        with transaction.atomic():
+            user = CustomUser.objects.create_user(username='benchmark-loader')
+            file_obj = CsvFile.objects.create(file_owner=user, raw_name='benchmark', display_name='benchmark-loader')
+
+            values = np.random.RandomState(0).normal(size=(options['rows'], options['columns']))
+            CsvFileData.objects.bulk_create(
+                (CsvFileData(parent_file=file_obj, column_header='c{}'.format(column_num),
+                             data=float(values[row_num, column_num]), row_num=row_num, column_num=column_num)
+                 for row_num in range(options['rows']) for column_num in range(options['columns'])),
+                batch_size=10000)
+
+            self._benchmark(file_obj.id, options['repeat'])
+            transaction.set_rollback(True)
@@ -0,0 +1,40 @@
+import time
+import numpy as np
+
+from django.core.management.base import BaseCommand
+
+from helpers.baselines import loop_match_acc, loop_r2
+from helpers.metrics import get_match_acc, get_r2
+
+
+class Command(BaseCommand):
+    help = 'Times the vectorized get_r2 and get_match_acc against the loops they replaced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _time(self, metric, y_pred, y_test):
+        start = time.perf_counter()
+        value = metric(y_pred, y_test)
+        return value, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        rng = np.random.RandomState(options['seed'])
+        y_test = rng.normal(size=options['rows'])
+        y_pred = y_test + rng.normal(scale=0.5, size=options['rows'])
+        labels_test = rng.randint(0, 5, size=options['rows'])
+        labels_pred = np.where(rng.random_sample(options['rows']) < 0.8,
+                               labels_test, rng.randint(0, 5, size=options['rows']))
+
+        cases = [
+            ('get_r2', get_r2, loop_r2, y_pred, y_test),
+            ('get_match_acc', get_match_acc, loop_match_acc, labels_pred, labels_test),
+        ]
+        for name, metric, loop_metric, pred, test in cases:
+            value, seconds = self._time(metric, pred, test)
+            loop_value, loop_seconds = self._time(loop_metric, pred, test)
+
+            self.stdout.write("{}, {} rows: loop {:.3f}s, vectorized {:.4f}s ({:.0f}x), {}".format(
+                name, len(test), loop_seconds, seconds, loop_seconds / seconds,
+                'same result' if value == loop_value else 'results differ: {} vs {}'.format(value, loop_value)))
@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from helpers.artifact_store import load_model_artifact
+from helpers.constants import COMPACT_CHECK_ROWS
+from helpers.model_builder import save_compact_model
+from helpers.model_cache import invalidate_model
+from helpers.model_predict import get_model_columns
+from helpers.util import get_columns_dataframe
+from mainsite.models import MLModel
+
+
+class Command(BaseCommand):
+    help = 'Saves a compact prediction copy of models trained before compact export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Export at most this many models')
+
+    def handle(self, *args, **options):
+        models = MLModel.objects.defer('data')\
+            .filter(compact_ref=None, parent_file__deleted_at=None)\
+            .order_by('id')
+        if options['limit']:
+            models = models[:options['limit']]
+
+        exported = 0
+        for model_obj in models:
+            input_columns, target_column = get_model_columns(model_obj)
+            check_rows = get_columns_dataframe(model_obj.parent_file_id, input_columns).values[:COMPACT_CHECK_ROWS]
+
+            parameters = json.loads(model_obj.parameters)
+            model = load_model_artifact(model_obj)
+            if not save_compact_model(model_obj, model, check_rows, parameters):
+                self.stdout.write("No compact form for model {} ({})".format(model_obj.id, model_obj.type))
+                continue
+
+            model_obj.parameters = json.dumps(parameters)
+            model_obj.save(update_fields=['compact_ref', 'compact_checksum', 'parameters'])
+            invalidate_model(model_obj.id)
+            exported += 1
+
+        self.stdout.write("Exported {} compact models".format(exported))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from helpers.artifact_store import migrate_legacy_model
+from mainsite.models import MLModel
+
+
+class Command(BaseCommand):
+    help = 'Moves models still pickled in MLModel.data to the artifact store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Migrate at most this many models')
+
+    def handle(self, *args, **options):
+        model_ids = MLModel.objects.filter(artifact_ref=None)\
+            .exclude(data=None)\
+            .order_by('id')\
+            .values_list('id', flat=True)
+        if options['limit']:
+            model_ids = model_ids[:options['limit']]
+
+        migrated = 0
+        # One model is unpickled at a time
+        for model_id in list(model_ids):
+            model_obj = MLModel.objects.get(id=model_id)
+            if migrate_legacy_model(model_obj) is not None:
+                migrated += 1
+
+        self.stdout.write("Migrated {} models to the artifact store".format(migrated))
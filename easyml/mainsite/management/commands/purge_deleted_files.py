@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from helpers.constants import PURGE_BATCH_ROWS
+from helpers.purge import purge_deleted_files
+
+
+class Command(BaseCommand):
+    help = 'Removes the rows and model artifacts of deleted files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Purge at most this many files')
+        parser.add_argument('--batch-rows', type=int, default=PURGE_BATCH_ROWS,
+                            help='Rows removed per DELETE statement')
+
+    def handle(self, *args, **options):
+        purged = purge_deleted_files(limit=options['limit'], batch_rows=options['batch_rows'])
+        self.stdout.write("Purged {} deleted files".format(purged))
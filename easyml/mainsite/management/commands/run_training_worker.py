@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from helpers.constants import JOB_POLL_INTERVAL
+from helpers.jobs import claim_next_job, recover_stale_jobs, run_training_job
+from helpers.purge import purge_deleted_files
+
+
+class Command(BaseCommand):
+    help = 'Runs queued model training jobs outside of the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=JOB_POLL_INTERVAL,
+                            help='Seconds to wait between checks of an empty queue')
+        parser.add_argument('--no-purge', action='store_true',
+                            help='Do not purge deleted files while the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            recovered = recover_stale_jobs()
+            if recovered:
+                self.stdout.write("Recovered {} stale training jobs".format(recovered))
+
+            job = claim_next_job()
+            if not job:
+                # Deleted files are purged one at a time so new jobs are not kept waiting
+                if not options['no_purge'] and purge_deleted_files(limit=1):
+                    self.stdout.write("Purged a deleted file")
+                    continue
+
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write("Running training job {}".format(job.id))
+            job = run_training_job(job)
+            self.stdout.write("Training job {} {}".format(job.id, job.status))
@@ -0,0 +1,26 @@
+# Generated by Django 2.1.2 on 2019-01-14 18:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0018_csvfiledata_placeholder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CsvFileColumn',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('column_header', models.CharField(max_length=255)),
+                ('column_num', models.IntegerField()),
+                ('type', models.IntegerField(blank=True, null=True)),
+                ('num_rows', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('parent_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='column_parent', to='mainsite.CsvFile')),
+            ],
+        ),
+    ]
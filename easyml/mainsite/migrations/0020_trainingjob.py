@@ -0,0 +1,31 @@
+# Generated by Django 2.1.2 on 2019-01-21 17:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0019_csvfilecolumn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm_type_num', models.IntegerField()),
+                ('parameters', models.TextField()),
+                ('status', models.CharField(default='queued', max_length=32)),
+                ('progress', models.FloatField(default=0)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('parent_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='job_parent', to='mainsite.CsvFile')),
+                ('result_model', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job_result', to='mainsite.MLModel')),
+            ],
+        ),
+    ]
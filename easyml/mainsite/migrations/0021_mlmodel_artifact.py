@@ -0,0 +1,29 @@
+# Generated by Django 2.1.2 on 2019-02-04 16:27
+
+from django.db import migrations, models
+import picklefield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0020_trainingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmodel',
+            name='artifact_checksum',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='mlmodel',
+            name='artifact_ref',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mlmodel',
+            name='data',
+            field=picklefield.fields.PickledObjectField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.2 on 2019-02-18 15:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0021_mlmodel_artifact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CsvFileCategory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('column_header', models.CharField(max_length=255)),
+                ('code', models.IntegerField()),
+                ('value', models.TextField()),
+                ('parent_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_parent', to='mainsite.CsvFile')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='csvfilecategory',
+            unique_together={('parent_file', 'column_header', 'code')},
+        ),
+    ]
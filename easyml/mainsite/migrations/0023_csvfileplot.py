@@ -0,0 +1,24 @@
+# Generated by Django 2.1.2 on 2019-02-21 10:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0022_csvfilecategory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CsvFilePlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.BinaryField()),
+                ('sample_rows', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('parent_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='plot_parent', to='mainsite.CsvFile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.1.2 on 2019-02-25 09:14
+
+from django.db import migrations, models
+
+# Indexes are built with CREATE INDEX CONCURRENTLY, so CsvFileData stays
+# writable while they are built. That cannot run inside a transaction, hence
+# atomic = False and raw SQL alongside the model state.
+INDEX_SQL = [
+    ('csvdata_file_header_row_idx', '(parent_file_id, column_header, row_num)'),
+    ('csvdata_file_type_col_idx', '(parent_file_id, type, column_num)'),
+    # Django 2.1 indexes cannot carry a condition, so the partial index used
+    # by the placeholder scans in get_itos_map/get_stoi_map has no model state
+    ('csvdata_file_placeholder_idx', '(parent_file_id, column_header) WHERE placeholder IS NOT NULL'),
+]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('mainsite', '0023_csvfileplot'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='csvfiledata',
+                    index=models.Index(fields=['parent_file', 'column_header', 'row_num'],
+                                       name='csvdata_file_header_row_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='csvfiledata',
+                    index=models.Index(fields=['parent_file', 'type', 'column_num'],
+                                       name='csvdata_file_type_col_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON mainsite_csvfiledata {}'.format(name, columns),
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name),
+                )
+                for name, columns in INDEX_SQL
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.2 on 2019-03-01 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0024_csvfiledata_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvfile',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
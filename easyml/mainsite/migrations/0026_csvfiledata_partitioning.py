@@ -0,0 +1,29 @@
+# Generated by Django 2.1.2 on 2019-03-05 11:48
+
+from django.conf import settings
+from django.db import migrations
+
+from helpers.partitioning import partition_cell_table, unpartition_cell_table
+
+
+def partition_cells(apps, schema_editor):
+    partition_cell_table(schema_editor.connection,
+                         settings.EASYML_CSVDATA_PARTITIONING,
+                         settings.EASYML_CSVDATA_HASH_PARTITIONS)
+
+
+def unpartition_cells(apps, schema_editor):
+    unpartition_cell_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0025_csvfile_deleted_at'),
+    ]
+
+    # Only changes the table when EASYML_CSVDATA_PARTITIONING is set and the
+    # database is Postgres; the model is the same either way
+    operations = [
+        migrations.RunPython(partition_cells, unpartition_cells),
+    ]
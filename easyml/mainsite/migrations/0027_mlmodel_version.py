@@ -0,0 +1,24 @@
+# Generated by Django 2.1.2 on 2019-03-12 14:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0026_csvfiledata_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmodel',
+            name='previous_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='next_versions', to='mainsite.MLModel'),
+        ),
+        migrations.AddField(
+            model_name='mlmodel',
+            name='version',
+            field=models.IntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.2 on 2019-03-14 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0027_mlmodel_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmodel',
+            name='compact_ref',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
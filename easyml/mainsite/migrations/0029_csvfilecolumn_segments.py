@@ -0,0 +1,71 @@
+# Generated by Django 2.1.2 on 2019-03-18 11:40
+
+import io
+import numpy as np
+
+from django.db import migrations, models
+
+SEGMENT_ROWS = 50000
+
+
+def _from_blob(blob):
+    return np.load(io.BytesIO(bytes(blob)), allow_pickle=False)
+
+
+def _to_blob(values):
+    buf = io.BytesIO()
+    np.save(buf, values, allow_pickle=False)
+    return buf.getvalue()
+
+
+# Splits the single blob of every existing column into segments, one column
+# at a time so only one column is held in memory
+def split_column_blobs(apps, schema_editor):
+    CsvFileColumn = apps.get_model('mainsite', 'CsvFileColumn')
+    column_ids = CsvFileColumn.objects.filter(num_rows__gt=SEGMENT_ROWS).values_list('id', flat=True)
+
+    for column_id in list(column_ids):
+        column = CsvFileColumn.objects.get(id=column_id)
+        values = _from_blob(column.data)
+
+        segments = []
+        for segment, start in enumerate(range(SEGMENT_ROWS, len(values), SEGMENT_ROWS), start=1):
+            segment_values = values[start:start + SEGMENT_ROWS]
+            segments.append(CsvFileColumn(parent_file_id=column.parent_file_id,
+                                          column_header=column.column_header,
+                                          column_num=column.column_num,
+                                          type=column.type,
+                                          segment=segment,
+                                          row_start=start,
+                                          num_rows=len(segment_values),
+                                          data=_to_blob(segment_values)))
+        CsvFileColumn.objects.bulk_create(segments)
+
+        column.data = _to_blob(values[:SEGMENT_ROWS])
+        column.num_rows = SEGMENT_ROWS
+        column.save(update_fields=['data', 'num_rows'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0028_mlmodel_compact_ref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvfilecolumn',
+            name='segment',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='csvfilecolumn',
+            name='row_start',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='csvfilecolumn',
+            unique_together={('parent_file', 'column_header', 'segment')},
+        ),
+        migrations.RunPython(split_column_blobs, migrations.RunPython.noop),
+    ]
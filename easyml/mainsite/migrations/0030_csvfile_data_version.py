@@ -0,0 +1,18 @@
+# Generated by Django 2.1.2 on 2019-03-16 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0029_csvfilecolumn_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvfile',
+            name='data_version',
+            field=models.IntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.2 on 2019-03-16 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0030_csvfile_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trainingjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.2 on 2019-03-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainsite', '0031_trainingjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmodel',
+            name='compact_checksum',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -4,6 +4,7 @@ import datetime
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from picklefield.fields import PickledObjectField
+from helpers.constants import JOB_STATUS
 
 class CustomUser(AbstractUser):
     # add additional fields in here
@@ -11,6 +12,12 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.email
 
+class LiveCsvFileManager(models.Manager):
+    """Hides files that are deleted and waiting to be purged."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at=None)
+
 class CsvFile(models.Model):
 
     file_owner = models.ForeignKey(
@@ -22,6 +29,14 @@ class CsvFile(models.Model):
     raw_name = models.CharField(max_length=255)
     display_name = models.CharField(max_length=255, unique=True, null=False, blank=False)
     created = models.DateTimeField(auto_now_add=True, blank=True)
+    # Set when the file is deleted; its rows are removed later by the purge
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Bumped whenever rows are appended; caches of the file's contents are
+    # keyed on it, so every process sees the change
+    data_version = models.IntegerField(default=1)
+
+    objects = LiveCsvFileManager()
+    all_objects = models.Manager()
 
 class CsvFileData(models.Model):
 
@@ -38,10 +53,74 @@ class CsvFileData(models.Model):
     column_num = models.IntegerField(null=False, blank=False)
     type = models.IntegerField(null=True, blank=True)
 
+    # Cells are always read by file plus header, type or placeholder. Migration
+    # 0024 also adds a partial index on the cells that have a placeholder.
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent_file', 'column_header', 'row_num'], name='csvdata_file_header_row_idx'),
+            models.Index(fields=['parent_file', 'type', 'column_num'], name='csvdata_file_type_col_idx'),
+        ]
+
+class CsvFileColumn(models.Model):
+
+    parent_file = models.ForeignKey(
+        'CsvFile',
+        related_name="column_parent",
+        null=False,
+        blank=False,
+        on_delete=models.CASCADE)
+    column_header = models.CharField(max_length=255)
+    column_num = models.IntegerField(null=False, blank=False)
+    type = models.IntegerField(null=True, blank=True)
+    # Each row holds one segment of a column: rows row_start to
+    # row_start + num_rows - 1, as written by one upload chunk
+    segment = models.IntegerField(default=0)
+    row_start = models.IntegerField(default=0)
+    num_rows = models.IntegerField(null=False, blank=False)
+    # Column values as a float64 .npy blob, encoded the same way as CsvFileData.data
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ('parent_file', 'column_header', 'segment')
+
+class CsvFileCategory(models.Model):
+
+    parent_file = models.ForeignKey(
+        'CsvFile',
+        related_name="category_parent",
+        null=False,
+        blank=False,
+        on_delete=models.CASCADE)
+    column_header = models.CharField(max_length=255)
+    code = models.IntegerField(null=False, blank=False)
+    value = models.TextField(null=False, blank=False)
+
+    class Meta:
+        unique_together = ('parent_file', 'column_header', 'code')
+
+class CsvFilePlot(models.Model):
+
+    parent_file = models.OneToOneField(
+        'CsvFile',
+        related_name="plot_parent",
+        null=False,
+        blank=False,
+        on_delete=models.CASCADE)
+    # Scatter matrix of the file's columns as a PNG
+    image = models.BinaryField()
+    sample_rows = models.IntegerField(null=False, blank=False)
+    created = models.DateTimeField(auto_now_add=True, blank=True)
+
 class MLModel(models.Model):
     type = models.CharField(max_length=255, blank=False, null=False)
     type_num = models.IntegerField(blank=False, null=False)
-    data = PickledObjectField()
+    # Legacy inline pickle; new models are written to the artifact store
+    data = PickledObjectField(null=True)
+    artifact_ref = models.CharField(max_length=255, null=True, blank=True)
+    artifact_checksum = models.CharField(max_length=64, null=True, blank=True)
+    # Compact copy used for prediction, see helpers.compact
+    compact_ref = models.CharField(max_length=255, null=True, blank=True)
+    compact_checksum = models.CharField(max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     parent_file = models.ForeignKey(
         'CsvFile',
@@ -54,3 +133,38 @@ class MLModel(models.Model):
     parameters = models.TextField(blank=False, null=False)
     accuracy = models.FloatField(null=True, blank=True)
     accuracy_type = models.CharField(max_length=255, null=True, blank=True)
+    # Set on models retrained from an earlier model of the same file
+    previous_version = models.ForeignKey(
+        'MLModel',
+        related_name="next_versions",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL)
+    version = models.IntegerField(default=1)
+
+class TrainingJob(models.Model):
+    parent_file = models.ForeignKey(
+        'CsvFile',
+        related_name="job_parent",
+        null=False,
+        blank=False,
+        on_delete=models.CASCADE)
+    algorithm_type_num = models.IntegerField(blank=False, null=False)
+    parameters = models.TextField(blank=False, null=False)
+    status = models.CharField(max_length=32, default=JOB_STATUS.QUEUED)
+    progress = models.FloatField(default=0)
+    message = models.TextField(null=True, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    result_model = models.ForeignKey(
+        'MLModel',
+        related_name="job_result",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Updated by the worker while the job runs; a job whose heartbeat stops
+    # is queued again, up to JOB_MAX_ATTEMPTS runs
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
@@ -1,3 +1,290 @@
-from django.test import TestCase
+import numpy as np
+import pickle
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from unittest import skipIf, skipUnless
+
+from sklearn.datasets import make_classification, make_regression
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.metrics import confusion_matrix, f1_score, log_loss, mean_absolute_error, mean_squared_error
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor
+from sklearn.neighbors.nearest_centroid import NearestCentroid
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC, SVR
+from sklearn.tree import DecisionTreeRegressor
+
+from helpers.baselines import loop_match_acc, loop_r2, per_column_dataframe
+from helpers.compact import CompactForest, CompactGaussianNB, CompactLinearModel, CompactNearestCentroid, \
+    CompactNeighbors, CompactSVM, export_compact_model
+from helpers.constants import COMPACT_MIN_AGREEMENT, COMPACT_REGRESSION_TOL
+from helpers.metrics import get_confusion_matrix, get_f1, get_log_loss, get_mae, get_match_acc, get_r2, get_rmse
+from helpers.util import get_dataframe
+from .models import CsvFile, CsvFileData, CustomUser
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN ' + sql, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The indexes are created with Postgres SQL')
+@skipIf(settings.EASYML_CSVDATA_PARTITIONING, 'Partition indexes have generated names')
+class CsvFileDataIndexTests(TestCase):
+    """The CsvFileData lookups keep using the indexes from migration 0024."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(username='index-tests', password='index-tests')
+        cls.file_obj = CsvFile.objects.create(file_owner=user, raw_name='cells', display_name='cells')
+
+        cells = []
+        for row_num in range(200):
+            for column_num, header in enumerate(['x', 'y', 'label']):
+                placeholder = 'class{}'.format(row_num % 3) if header == 'label' else None
+                cells.append(CsvFileData(parent_file=cls.file_obj, column_header=header, data=row_num % 3,
+                                         placeholder=placeholder, row_num=row_num, column_num=column_num,
+                                         type=0))
+        CsvFileData.objects.bulk_create(cells)
+
+    def setUp(self):
+        # The table is too small for the planner to prefer an index on its own
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = explain(queryset)
+        self.assertIn(index_name, plan, plan)
+
+    def test_header_rows_use_header_row_index(self):
+        queryset = CsvFileData.objects.filter(parent_file=self.file_obj, column_header='x').order_by('row_num')
+        self.assertUsesIndex(queryset, 'csvdata_file_header_row_idx')
+
+    def test_typed_columns_use_type_index(self):
+        queryset = CsvFileData.objects.filter(parent_file=self.file_obj, type=0).order_by('column_num')
+        self.assertUsesIndex(queryset, 'csvdata_file_type_col_idx')
+
+    def test_placeholder_scan_uses_partial_index(self):
+        queryset = CsvFileData.objects.filter(parent_file=self.file_obj, column_header='label')\
+            .exclude(placeholder=None)
+        self.assertUsesIndex(queryset, 'csvdata_file_placeholder_idx')
+
+
+class GetDataframeTests(TestCase):
+    """get_dataframe returns the frame of the per-column loader it replaced."""
+
+    def test_matches_per_column_loader(self):
+        user = CustomUser.objects.create_user(username='loader-tests', password='loader-tests')
+        file_obj = CsvFile.objects.create(file_owner=user, raw_name='loader', display_name='loader')
+
+        cells = []
+        for row_num in range(50):
+            for column_num, header in enumerate(['a', 'b', 'c']):
+                data = None if (row_num + column_num) % 7 == 0 else row_num * 10.0 + column_num
+                cells.append(CsvFileData(parent_file=file_obj, column_header=header, data=data,
+                                         row_num=row_num, column_num=column_num))
+        CsvFileData.objects.bulk_create(cells)
+
+        qry_data = CsvFileData.objects.filter(parent_file=file_obj)
+        expected = per_column_dataframe(qry_data).astype(float)
+        actual = get_dataframe(qry_data)
+
+        self.assertEqual(list(actual.columns), ['a', 'b', 'c'])
+        self.assertTrue(actual[expected.columns].equals(expected))
+
+
+class MetricsTests(SimpleTestCase):
+    """The vectorized metrics agree with the loops they replaced."""
+
+    def test_r2_matches_loop(self):
+        rng = np.random.RandomState(0)
+        y_test = rng.normal(size=1000)
+        y_pred = y_test + rng.normal(scale=0.3, size=1000)
+
+        self.assertAlmostEqual(get_r2(y_pred, y_test), loop_r2(y_pred, y_test), delta=1e-4)
+
+    def test_match_acc_matches_loop(self):
+        y_test = np.array(['a', 'b', 'c', 'a', 'b'] * 20, dtype=object)
+        y_pred = np.array(['a', 'c', 'c', 'a', 'a'] * 20, dtype=object)
+
+        self.assertEqual(get_match_acc(y_pred, y_test), loop_match_acc(y_pred, y_test))
+        self.assertEqual(get_match_acc(y_pred, y_test), 60.0)
+
+    def test_match_acc_of_no_rows(self):
+        self.assertEqual(get_match_acc([], []), 0)
+
+
+class SklearnMetricsTests(SimpleTestCase):
+    """The metrics agree with sklearn.metrics."""
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.y_test = rng.normal(size=1000)
+        self.y_pred = self.y_test + rng.normal(scale=0.3, size=1000)
+        self.labels_test = rng.randint(0, 4, size=1000)
+        self.labels_pred = np.where(rng.random_sample(1000) < 0.7, self.labels_test, rng.randint(0, 4, size=1000))
+
+    def test_mae(self):
+        expected = mean_absolute_error(self.y_test, self.y_pred)
+        self.assertAlmostEqual(get_mae(self.y_pred, self.y_test), expected, places=4)
+
+    def test_rmse(self):
+        expected = np.sqrt(mean_squared_error(self.y_test, self.y_pred))
+        self.assertAlmostEqual(get_rmse(self.y_pred, self.y_test), expected, places=4)
+
+    def test_f1(self):
+        expected = f1_score(self.labels_test, self.labels_pred, average='macro') * 100.0
+        self.assertAlmostEqual(get_f1(self.labels_pred, self.labels_test), expected, places=4)
+
+    def test_f1_counts_labels_only_predicted(self):
+        y_test = np.array(['a', 'a', 'b', 'b'], dtype=object)
+        y_pred = np.array(['a', 'c', 'b', 'b'], dtype=object)
+
+        expected = f1_score(y_test, y_pred, average='macro') * 100.0
+        self.assertAlmostEqual(get_f1(y_pred, y_test), expected, places=4)
+
+    def test_confusion_matrix(self):
+        labels, matrix = get_confusion_matrix(self.labels_pred, self.labels_test)
+
+        self.assertEqual(labels.tolist(), [0, 1, 2, 3])
+        np.testing.assert_array_equal(matrix, confusion_matrix(self.labels_test, self.labels_pred, labels=labels))
+
+    def test_log_loss(self):
+        rng = np.random.RandomState(1)
+        labels = np.array(['x', 'y', 'z'], dtype=object)
+        y_test = labels[rng.randint(0, 3, size=500)]
+        y_proba = rng.dirichlet(np.ones(3), size=500)
+
+        expected = log_loss(y_test, y_proba, labels=labels)
+        self.assertAlmostEqual(get_log_loss(y_proba, y_test, labels), expected, places=4)
+
+    def test_single_class(self):
+        y = np.ones(10, dtype=int)
+
+        self.assertEqual(get_f1(y, y), f1_score(y, y, average='macro') * 100.0)
+        labels, matrix = get_confusion_matrix(y, y)
+        self.assertEqual(labels.tolist(), [1])
+        np.testing.assert_array_equal(matrix, confusion_matrix(y, y))
+
+        y_proba = np.tile([0.2, 0.8], (10, 1))
+        self.assertAlmostEqual(get_log_loss(y_proba, y, [0, 1]), log_loss(y, y_proba, labels=[0, 1]), places=4)
+
+    def test_constant_regression(self):
+        y = np.full(10, 3.0)
+
+        self.assertEqual(get_mae(y, y), mean_absolute_error(y, y))
+        self.assertEqual(get_rmse(y, y), np.sqrt(mean_squared_error(y, y)))
+
+    def test_empty(self):
+        empty = np.array([])
+
+        self.assertEqual(get_mae(empty, empty), 0)
+        self.assertEqual(get_rmse(empty, empty), 0)
+        self.assertEqual(get_f1(empty, empty), 0)
+        self.assertEqual(get_match_acc(empty, empty), 0)
+        labels, matrix = get_confusion_matrix(empty, empty)
+        self.assertEqual(len(labels), 0)
+        self.assertEqual(matrix.shape, (0, 0))
+
+
+class CompactModelTests(SimpleTestCase):
+    """Compact models predict what the estimators they were exported from do."""
+
+    def setUp(self):
+        x, y = make_classification(n_samples=1200, n_features=8, n_informative=5, n_classes=3, random_state=0)
+        self.x_train, self.y_train = x[:1000], y[:1000]
+        self.x_check = x[1000:]
+
+    def assertClassifierParity(self, model, compact_class):
+        model.fit(self.x_train, self.y_train)
+        compact = export_compact_model(model, self.x_check)
+
+        self.assertIsInstance(compact, compact_class)
+        # Compact models are served from a pickle, so check the loaded copy
+        compact = pickle.loads(pickle.dumps(compact))
+        agreement = np.mean(compact.predict(self.x_check) == model.predict(self.x_check))
+        self.assertGreaterEqual(agreement, COMPACT_MIN_AGREEMENT)
+        return compact
+
+    def assertRegressorParity(self, model, compact_class):
+        x, y = make_regression(n_samples=1200, n_features=8, noise=5.0, random_state=0)
+        model.fit(x[:1000], y[:1000])
+        compact = export_compact_model(model, x[1000:])
+
+        self.assertIsInstance(compact, compact_class)
+        compact = pickle.loads(pickle.dumps(compact))
+        expected = model.predict(x[1000:])
+        tolerance = COMPACT_REGRESSION_TOL * np.std(expected)
+        self.assertLessEqual(np.max(np.abs(compact.predict(x[1000:]) - expected)), tolerance)
+        return compact
+
+    def test_logistic_regression_pipeline(self):
+        model = Pipeline([('std_scaler', StandardScaler()), ('log_regression', LogisticRegression(
+            multi_class='auto', solver='lbfgs'))])
+        self.assertClassifierParity(model, CompactLinearModel)
+
+    def test_linear_discriminant_analysis(self):
+        self.assertClassifierParity(LinearDiscriminantAnalysis(), CompactLinearModel)
+
+    def test_gaussian_naive_bayes(self):
+        self.assertClassifierParity(GaussianNB(), CompactGaussianNB)
+
+    def test_nearest_centroid(self):
+        self.assertClassifierParity(NearestCentroid(), CompactNearestCentroid)
+
+    def test_random_forest_classifier(self):
+        model = RandomForestClassifier(n_estimators=20, random_state=0)
+        compact = self.assertClassifierParity(model, CompactForest)
+
+        self.assertEqual(compact.threshold.dtype, np.float32)
+        self.assertEqual(compact.n_trees, 20)
+
+    def test_random_forest_regressor(self):
+        self.assertRegressorParity(RandomForestRegressor(n_estimators=20, random_state=0), CompactForest)
+
+    def test_decision_tree_regressor(self):
+        self.assertRegressorParity(DecisionTreeRegressor(random_state=0), CompactForest)
+
+    def test_nearest_neighbors(self):
+        compact = self.assertClassifierParity(KNeighborsClassifier(), CompactNeighbors)
+        self.assertEqual(compact.x.dtype, np.float32)
+        self.assertRegressorParity(KNeighborsRegressor(), CompactNeighbors)
+
+    def test_support_vector_machines(self):
+        compact = self.assertClassifierParity(SVC(gamma='scale'), CompactSVM)
+        self.assertEqual(compact.support_vectors.dtype, np.float32)
+        self.assertRegressorParity(SVR(gamma='scale'), CompactSVM)
+
+    def test_linear_regression_is_quantized_when_close_enough(self):
+        rng = np.random.RandomState(0)
+        x = rng.normal(size=(1200, 4))
+        # Weights that are whole multiples of the int8 step (1.27 / 127)
+        y = x.dot([1.27, -0.64, 0.25, 0.13]) + 4.0
+        model = LinearRegression().fit(x[:1000], y[:1000])
+
+        compact = export_compact_model(model, x[1000:])
+        self.assertIsInstance(compact, CompactLinearModel)
+        self.assertTrue(compact.quantized)
+
+    def test_linear_regression_falls_back_to_float32(self):
+        # The small weight rounds to zero in int8, so only float32 is close enough
+        rng = np.random.RandomState(0)
+        x = rng.normal(size=(1200, 2))
+        x[:, 1] *= 1000
+        y = 1000 * x[:, 0] + 0.37 * x[:, 1]
+        model = LinearRegression().fit(x[:1000], y[:1000])
+
+        compact = export_compact_model(model, x[1000:])
+        self.assertIsInstance(compact, CompactLinearModel)
+        self.assertFalse(compact.quantized)
+
+        expected = model.predict(x[1000:])
+        tolerance = COMPACT_REGRESSION_TOL * np.std(expected)
+        self.assertLessEqual(np.max(np.abs(compact.predict(x[1000:]) - expected)), tolerance)
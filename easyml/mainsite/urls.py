@@ -1,12 +1,11 @@
 from django.urls import path
 from . import views
-from django.views.generic.base import TemplateView
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('signup/', views.user_signup, name='signup'),
     path('login/', views.user_login, name='login'),
-    path('upload/', TemplateView.as_view(template_name='upload_csv.html'), name='upload'),
+    path('upload/', views.upload_csv, name='upload'),
     path('upload/csv/', views.upload_csv, name='upload_csv'),
     path('upload/csv/<str:next>/', views.upload_csv, name='upload_csv'),
     path('manage/data/', views.manage_data, name='manage_data'),
@@ -15,6 +14,7 @@ urlpatterns = [
     path('manage/data/rename-file/', views.rename_file, name='rename_file'),
     path('manage/models/delete-model/<int:model_id>', views.delete_model, name='delete_model'),
     path('manage/models/rename-model/', views.rename_model, name='rename_model'),
+    path('manage/models/retrain-model/<int:model_id>', views.retrain_model, name='retrain_model'),
     path('train/setup/select-csv/<str:purpose>', views.select_csv, name='select_csv'),
     path('predict/setup/select-csv/<str:purpose>', views.select_csv, name='select_csv'),
     path('compare/setup/', views.select_compare, name='select_compare'),
@@ -1,28 +1,34 @@
-import csv
-import base64
+import itertools
 import pandas as pd
 import numpy as np
 import traceback
-import io
-import matplotlib
-import matplotlib.pyplot as plt
-import PIL, PIL.Image
-
-from matplotlib import pylab
-from pylab import *
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-
-from helpers.constants import COLUMN_TYPE, ALGORITHM_NAME_MAP, PLOT_FEATURE_CAP
-from helpers.model_builder import create_model
-from helpers.model_predict import run_model_predict
+
+from helpers.constants import COLUMN_TYPE, ALGORITHM_NAME_MAP, SAMPLING_PARAMS, UPLOAD_CHUNK_ROWS
+from helpers.ingest import CsvDataWriter, append_chunks, find_text_columns, ingest_chunks
+from helpers.jobs import enqueue_retraining_job, enqueue_training_job
+from helpers.artifact_store import delete_model_artifact
+from helpers.categories import get_file_categories, invalidate_file_categories
+from helpers.model_cache import invalidate_model
+from helpers.model_predict import iter_model_predict
+from helpers.plotting import plot_allowed, refresh_file_plot, schedule_file_plot
+from helpers.purge import soft_delete_file
+from helpers.result_writer import (
+    CSV_CONTENT_TYPE,
+    PARQUET_CONTENT_TYPE,
+    iter_csv_chunks,
+    iter_parquet_chunks,
+    parquet_available,
+)
+from helpers.serving import drop_batcher
 from helpers.util import *
 
-from .models import CsvFile, CsvFileData, MLModel
+from .models import CsvFile, MLModel
 from django.shortcuts import render
 from django.contrib import messages
+from django.db import transaction
 from django.http import HttpResponse, HttpResponseRedirect
 from django.http import StreamingHttpResponse
-from django.urls import reverse_lazy, reverse
+from django.urls import reverse_lazy
 from django.views import generic
 from django.contrib.auth import authenticate, login
 from .forms import CustomUserCreationForm
@@ -83,19 +89,18 @@ def user_login(request):
 def upload_csv(request, next=None):
     data = {}
     if "GET" == request.method:
+        data['valid_files'] = get_user_files(request.user)
         return render(request, "upload_csv.html", data)
 
+    if request.POST.get('append_to'):
+        return append_csv(request)
+
     csv_obj_id = None
     # if not GET, then proceed
     try:
         csv_file = request.FILES["csv_file"]
         file_type = request.POST.get('file_type')
 
-        # if file is too large, return
-        if csv_file.multiple_chunks():
-            messages.error(request, "Uploaded file is too big (%.2f MB)" % (csv_file.size / (1000 * 1000),))
-            return HttpResponseRedirect(reverse("upload_csv"))
-
         ext_index = csv_file.name.find('.')
         if ext_index == -1:
             csv_name = csv_file.name
@@ -110,58 +115,51 @@ def upload_csv(request, next=None):
         csv_obj.save()
         csv_obj_id = csv_obj.id
 
-        if file_type == 'comma':
-            file_data = pd.read_csv(csv_file)
-        elif file_type == 'tab':
-            file_data = pd.read_csv(csv_file, sep='\t')
-        else:
-            file_data = pd.read_excel(csv_file)
-
-        columns = list(file_data.columns.values)
+        ingest_chunks(csv_obj, read_upload_chunks(csv_file, file_type))
+        schedule_file_plot(csv_obj_id)
 
-        csv_stoi_map = {}
-        csv_data = []
-        for row_index, row in file_data.iterrows():
-            for i in range(len(columns)):
-                header = columns[i]
-                if 'unnamed' in header.lower():
-                    continue
-                data_obj = CsvFileData(parent_file=csv_obj)
-
-                if not isinstance(row[header], int) and not isinstance(row[header], float):
-                    str_val = row[header]
-                    data_obj.placeholder = str_val
+    except Exception as e:
+        if csv_obj_id and CsvFile.objects.filter(id=csv_obj_id).count() > 0:
+            soft_delete_file(CsvFile.objects.get(id=csv_obj_id))
+        messages.error(request, "Unable to upload file. " + repr(e))
+        return HttpResponseRedirect('/easyml/upload/csv')
 
-                    if header not in csv_stoi_map:
-                        csv_stoi_map[header] = {}
-                    if str_val not in csv_stoi_map[header]:
-                        row_data = len(csv_stoi_map[header].keys())
-                        csv_stoi_map[header][str_val] = row_data
+    #messages.success(request, "File successfully uploaded")
 
-                    data_obj.data = csv_stoi_map[header][str_val]
+    return HttpResponseRedirect('/easyml/')
 
-                else:
-                    data_obj.data = row[header]
+# Text files are read and stored in bounded chunks; Excel cannot be streamed.
+# Columns with text anywhere in the file (plus the given text_columns) are
+# read as strings in every chunk, found by a first pass over the file.
+def read_upload_chunks(csv_file, file_type, text_columns=()):
+    if file_type not in ('comma', 'tab'):
+        return [pd.read_excel(csv_file, dtype={header: object for header in text_columns})]
 
-                data_obj.row_num = row_index
-                data_obj.column_num = i
-                data_obj.column_header = header
-                csv_data.append(data_obj)
+    sep = ',' if file_type == 'comma' else '\t'
+    text_columns = set(text_columns) | find_text_columns(pd.read_csv(csv_file, sep=sep, chunksize=UPLOAD_CHUNK_ROWS))
+    csv_file.seek(0)
 
-            if len(csv_data) > 500:
-                CsvFileData.objects.bulk_create(csv_data)
-                csv_data = []
+    return pd.read_csv(csv_file, sep=sep, chunksize=UPLOAD_CHUNK_ROWS,
+                       dtype={header: object for header in text_columns})
 
-        CsvFileData.objects.bulk_create(csv_data)
+def append_csv(request):
+    file_obj = CsvFile.objects.filter(id=int(request.POST.get('append_to'))).first()
+    if not file_obj or file_obj.file_owner != request.user:
+        messages.error(request, "Unable to append rows - Invalid File ID")
+        return HttpResponseRedirect('/easyml/upload/csv')
 
+    try:
+        with transaction.atomic():
+            chunks = read_upload_chunks(request.FILES["csv_file"], request.POST.get('file_type'),
+                                        text_columns=get_categorical_headers(file_obj.id))
+            append_chunks(file_obj, chunks)
     except Exception as e:
-        if csv_obj_id and CsvFile.objects.filter(id=csv_obj_id).count() > 0:
-            CsvFile.objects.get(id=csv_obj_id).delete()
-        messages.error(request, "Unable to upload file. " + repr(e))
+        messages.error(request, "Unable to append rows. " + repr(e))
         return HttpResponseRedirect('/easyml/upload/csv')
 
-    #messages.success(request, "File successfully uploaded")
+    refresh_file_plot(file_obj.id)
 
+    messages.success(request, "Rows appended to {}".format(file_obj.display_name))
     return HttpResponseRedirect('/easyml/')
 
 def manage_data(request):
@@ -192,7 +190,12 @@ def delete_file(request, file_id=None):
         messages.error(request, "Unable to delete file - Invalid Permissions")
         return HttpResponseRedirect('manage_data.html')
 
-    file_obj.delete()
+    # Rows and model artifacts are removed later by purge_deleted_files
+    soft_delete_file(file_obj)
+    invalidate_file_categories(file_id)
+    for model_id in MLModel.objects.filter(parent_file=file_obj).values_list('id', flat=True):
+        invalidate_model(model_id)
+        drop_batcher(model_id)
     messages.success(request, "File deleted successfully")
     return HttpResponseRedirect('/easyml/manage/data')
 
@@ -224,17 +227,31 @@ def delete_model(request, model_id=None):
         return HttpResponseRedirect('manage_models.html')
 
     model_id = int(model_id)
-    model_obj = MLModel.objects.get(id=model_id)
+    model_obj = MLModel.objects.defer('data').get(id=model_id)
 
     if not model_obj.parent_file.file_owner == request.user:
         messages.error(request, "Unable to delete model - Invalid Permissions")
         return HttpResponseRedirect('manage_models.html')
 
     model_obj.delete()
+    delete_model_artifact(model_obj)
+    invalidate_model(model_id)
+    drop_batcher(model_id)
     messages.success(request, "Model deleted successfully")
     return HttpResponseRedirect('/easyml/manage/models')
 
 
+def retrain_model(request, model_id=None):
+    model_obj = MLModel.objects.defer('data').filter(id=model_id).first()
+    if not model_obj or model_obj.parent_file.file_owner != request.user:
+        messages.error(request, "Unable to retrain model - Invalid Permissions")
+        return HttpResponseRedirect('/easyml/manage/models')
+
+    enqueue_retraining_job(model_obj)
+    messages.success(request, "Retraining started. The new version will appear under Manage Models when finished.")
+    return HttpResponseRedirect('/easyml/manage/models')
+
+
 def rename_model(request):
     if "GET" == request.method:
         return render(request, "manage_data.html", {})
@@ -249,9 +266,10 @@ def rename_model(request):
         messages.error(request, "A model with that name already exists")
         return HttpResponseRedirect('/easyml/manage/models')
 
-    model_obj = MLModel.objects.get(id=model_id)
+    model_obj = MLModel.objects.defer('data').get(id=model_id)
     model_obj.display_name = new_name
-    model_obj.save()
+    model_obj.save(update_fields=['display_name'])
+    invalidate_model(model_id)
 
     messages.success(request, "Model successfully renamed")
     return HttpResponseRedirect('/easyml/manage/models')
@@ -284,29 +302,14 @@ def select_columns_and_alg(request):
     if request.user != CsvFile.objects.get(id=file_id).file_owner:
         return HttpResponseRedirect('/easyml/train/setup/select-csv')
 
-    headers = CsvFileData.objects.filter(parent_file_id=file_id)\
-        .order_by('column_num')\
-        .values_list('column_header', flat=True)\
-        .distinct()
+    headers = get_file_headers(file_id)
 
     context['headers'] = headers
     context['file_id'] = file_id
     context['algorithms'] = get_alg_lst()
 
-    file_data = CsvFileData.objects.filter(parent_file_id=file_id).order_by('column_num')
-
-    if len(set(file_data.values_list('column_num', flat=True))) <= PLOT_FEATURE_CAP:
-        f = matplotlib.figure.Figure()
-        buf = io.BytesIO()
-
-        data_df = get_dataframe(file_data)
-        pd.plotting.scatter_matrix(data_df)
-        plt.gcf().subplots_adjust(bottom=0.15)
-
-        plt.savefig(buf, format='png')
-        plt.close(f)
-
-        context['graphic'] = base64.b64encode(buf.getvalue()).decode('ascii')
+    # The scatter matrix is rendered in the background and fetched by the page
+    context['show_plot'] = plot_allowed(headers)
 
     return render(request, 'select_columns_and_alg.html', context=context)
 
@@ -319,10 +322,7 @@ def select_columns_and_model(request):
     if request.user != CsvFile.objects.get(id=file_id).file_owner:
         return HttpResponseRedirect('/easyml/train/setup/select-csv')
 
-    headers = CsvFileData.objects.filter(parent_file_id=file_id)\
-        .order_by('column_num')\
-        .values_list('column_header', flat=True)\
-        .distinct()
+    headers = get_file_headers(file_id)
 
     context['headers'] = headers
     context['file_id'] = file_id
@@ -347,11 +347,11 @@ def create_data(request):
     file_id = int(request.POST.get('file_id'))
     alg_id = int(request.POST.get('algorithm'))
     header_map = {}
-    file_headers = CsvFileData.objects.filter(parent_file_id=file_id).values_list('column_header', flat=True).distinct()
+    file_headers = get_file_headers(file_id)
     for head in file_headers:
         header_map[head] = designation_map.get(request.POST.get(head), None)
 
-    parameters = {key: request.POST.get(key, None) for key in ALGORITHM_PARAM_MAP[alg_id]}
+    parameters = {key: request.POST.get(key, None) for key in ALGORITHM_PARAM_MAP[alg_id] + SAMPLING_PARAMS}
 
     error_context = request.POST.dict()
     error_context['headers'] = header_map.keys()
@@ -363,7 +363,8 @@ def create_data(request):
         messages.error(request, str(e))
         return render(request, 'select_columns_and_alg.html', context=error_context)
 
-    create_model(alg_id, file_id, parameters)
+    enqueue_training_job(file_id, alg_id, parameters)
+    messages.success(request, "Model training started. It will appear under Manage Models when finished.")
 
     return HttpResponseRedirect('/easyml/')
 
@@ -390,6 +391,7 @@ def run_model(request):
 
     file_id = int(request.POST.get('file_id'))
     model_id = request.POST.get('model_select')
+    output_format = request.POST.get('output_format', 'csv')
 
     designation_map = {
         'ignore': COLUMN_TYPE.IGNORE,
@@ -398,7 +400,7 @@ def run_model(request):
     }
 
     header_map = {}
-    ignore_keys = ['csrfmiddlewaretoken', 'file_id', 'model_select']
+    ignore_keys = ['csrfmiddlewaretoken', 'file_id', 'model_select', 'output_format']
     for prop in request.POST:
         if prop in ignore_keys:
             continue
@@ -416,16 +418,21 @@ def run_model(request):
         return render(request, 'select_columns_and_model.html', context=error_context)
 
     file_obj = CsvFile.objects.get(id=file_id)
-    model_obj = MLModel.objects.get(id=model_id)
+    model_obj = MLModel.objects.defer('data').get(id=model_id)
     model_parent_file_id = model_obj.parent_file.id
 
     filename = "{}-results".format(model_obj.display_name.replace(" ", ""))
 
-    csv_data, file_data = run_model_predict(file_obj, model_obj)
-    raw_rows = csv_data.split('\n')
-    row_data = []
-    for row in raw_rows:
-        row_data.append(row.split(','))
+    if output_format == 'parquet' and not parquet_available():
+        messages.error(request, "Parquet output is not available on this server")
+        return render(request, 'select_columns_and_model.html', context=error_context)
+
+    result_chunks = iter_model_predict(file_obj, model_obj)
+    try:
+        first_chunk = next(result_chunks)
+    except (ValueError, StopIteration):
+        messages.error(request, "No data to run the model on")
+        return render(request, 'select_columns_and_model.html', context=error_context)
 
     csv_name = filename
     user = request.user
@@ -435,37 +442,27 @@ def run_model(request):
     csv_obj = CsvFile(raw_name=filename, display_name=csv_name, file_owner=user)
     csv_obj.save()
 
-    columns = list(file_data.columns.values)
-
-    csv_stoi_map = get_stoi_map(model_parent_file_id)
-    csv_data = []
-    for row_index, row in file_data.iterrows():
-        for i in range(len(columns)):
-            header = columns[i]
-            if pd.isna(row[header]) or 'unnamed' in header.lower():
-                continue
-            data_obj = CsvFileData(parent_file=csv_obj)
-            if header in csv_stoi_map:
-                data_obj.data = csv_stoi_map[header][row[header]]
-                data_obj.placeholder = row[header]
-            else:
-                data_obj.data = row[header]
-
-            data_obj.row_num = row_index
-            data_obj.column_num = i
-            data_obj.column_header = header
-            csv_data.append(data_obj)
-
-        if len(csv_data) > 500:
-            CsvFileData.objects.bulk_create(csv_data)
-            csv_data = []
-
-    CsvFileData.objects.bulk_create(csv_data)
-
-    pseudo_buffer = Echo()
-    writer = csv.writer(pseudo_buffer)
-    response = StreamingHttpResponse((writer.writerow(row) for row in row_data), content_type="text/csv")
-
-    response['Content-Disposition'] = 'attachment; filename="{}.csv"'.format(filename)
+    # Results are stored with the model's parent file codes as they stream out
+    result_writer = CsvDataWriter(csv_obj, category_codes=get_file_categories(model_parent_file_id).stoi_map)
+
+    def persisted_chunks():
+        completed = False
+        try:
+            for chunk_df in itertools.chain([first_chunk], result_chunks):
+                result_writer.write_chunk(chunk_df)
+                yield chunk_df
+
+            result_writer.finish()
+            completed = True
+        finally:
+            if not completed:
+                soft_delete_file(csv_obj)
+
+    if output_format == 'parquet':
+        response = StreamingHttpResponse(iter_parquet_chunks(persisted_chunks()), content_type=PARQUET_CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="{}.parquet"'.format(filename)
+    else:
+        response = StreamingHttpResponse(iter_csv_chunks(persisted_chunks()), content_type=CSV_CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="{}.csv"'.format(filename)
 
     return response
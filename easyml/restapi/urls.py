@@ -3,5 +3,10 @@ from . import views
 
 urlpatterns = [
     path('get_file_headers/<int:file_id>', views.GetFileHeaders.as_view(), name='get_file_headers'),
+    path('files/<int:file_id>/scatter_matrix.png', views.FileScatterMatrix.as_view(), name='file_scatter_matrix'),
     path('get_accuracy/<int:ffid>&<int:sfid>&<str:header>&<str:method>', views.GetAccuracy.as_view(), name='get_accuracy'),
+    path('training_jobs', views.TrainingJobList.as_view(), name='training_jobs'),
+    path('training_jobs/<int:job_id>', views.TrainingJobStatus.as_view(), name='training_job_status'),
+    path('training_jobs/<int:job_id>/cancel', views.CancelTrainingJob.as_view(), name='cancel_training_job'),
+    path('models/<int:model_id>/predict', views.PredictModel.as_view(), name='predict_model'),
 ]
\ No newline at end of file
@@ -7,9 +7,15 @@ from rest_framework.exceptions import (
     APIException,
 )
 from rest_framework import viewsets, mixins
-from django.http import JsonResponse, Http404
+from django.http import HttpResponse, JsonResponse, Http404
 from django.http import HttpResponseForbidden
 
+import msgpack
+
+from helpers.compare import compare_file_columns
+from helpers.jobs import cancel_job, get_user_jobs, job_to_dict
+from helpers.plotting import PLOT_CONTENT_TYPE, get_file_plot, plot_allowed, schedule_file_plot
+from helpers.serving import PredictionError, get_batcher
 from helpers.util import *
 from mainsite.models import *
 
@@ -30,14 +36,36 @@ class GetFileHeaders(BaseUserView):
         if file_obj.file_owner != request.user:
             raise HttpResponseForbidden
 
-        data_raw = CsvFileData.objects.filter(parent_file_id=file_id)\
-            .values_list('column_header', flat=True)\
-            .distinct()
-
-        header_data = {'headers': sorted(list(data_raw))}
+        header_data = {'headers': sorted(get_file_headers(file_id))}
 
         return JsonResponse(header_data)
 
+class FileScatterMatrix(BaseUserView):
+    """Serves the stored scatter-matrix PNG of a file.
+
+    Answers 202 and queues the render if the plot does not exist yet.
+    """
+
+    def get(self, request, file_id=None):
+        file_obj = CsvFile.objects.filter(id=file_id).first()
+        if not file_obj:
+            raise Http404
+
+        if file_obj.file_owner != request.user:
+            raise PermissionDenied
+
+        plot = get_file_plot(file_id)
+        if plot:
+            response = HttpResponse(bytes(plot.image), content_type=PLOT_CONTENT_TYPE)
+            response['Cache-Control'] = 'private, max-age=86400'
+            return response
+
+        if not plot_allowed(get_file_headers(file_id)):
+            raise Http404
+
+        schedule_file_plot(file_obj.id)
+        return JsonResponse({'status_code': 202, 'messages': ['Plot is being rendered']}, status=202)
+
 class GetAccuracy(BaseUserView):
 
     def get(self, request, ffid=None, sfid=None, header=None, method=None):
@@ -56,60 +84,87 @@ class GetAccuracy(BaseUserView):
         ffid = int(ffid)
         sfid = int(sfid)
 
-        first_data_raw = CsvFileData.objects.filter(parent_file_id=ffid,
-                                                    column_header=header) \
-            .order_by('row_num')
-
-        second_data_raw = CsvFileData.objects.filter(parent_file_id=sfid,
-                                                     column_header=header) \
-            .order_by('row_num')
-
-        itos_map1 = get_itos_map(ffid)
-        itos_map2 = get_itos_map(sfid)
-
-        first_data = []
-        for dpoint in first_data_raw:
-            if dpoint.column_header in itos_map1:
-                first_data.append(itos_map1[dpoint.column_header][dpoint.data])
-            else:
-                first_data.append(dpoint.data)
-
-        second_data = []
-        for dpoint in second_data_raw:
-            if dpoint.column_header in itos_map2:
-                second_data.append(itos_map2[dpoint.column_header][dpoint.data])
-            else:
-                second_data.append(dpoint.data)
-
-        if len(first_data) != len(second_data):
-            messages = []
-            if len(second_data) == 0:
-                fname = CsvFile.objects.get(id=sfid).display_name
-                messages.append('Header "{}" does not exist in file "{}"'.format(header, fname))
-
-            messages.append('Length of the two files is not identical. {} vs {} rows.'
-                            .format(len(first_data), len(second_data)))
-
-            return JsonResponse({
-                'status_code': 500,
-                'messages': messages
-            })
-
-        if 'accuracy' in method.lower():
-            acc = str(get_match_acc(first_data, second_data)) + "%"
-            accuracy_type = 'Accuracy'
-            method_sm = 'Accuracy'
+        context = compare_file_columns(ffid, sfid, header, method)
+
+        return JsonResponse(context)
+
+
+class TrainingJobList(BaseUserView):
+
+    def get(self, request):
+        jobs = [job_to_dict(job) for job in get_user_jobs(request.user)]
+
+        return JsonResponse({'jobs': jobs})
+
+
+class TrainingJobStatus(BaseUserView):
+
+    def get_job(self, request, job_id):
+        job = TrainingJob.objects.filter(id=job_id).select_related('parent_file').first()
+        if not job:
+            raise Http404
+
+        if job.parent_file.file_owner != request.user:
+            raise PermissionDenied
+
+        return job
+
+    def get(self, request, job_id=None):
+        job = self.get_job(request, job_id)
+
+        return JsonResponse(job_to_dict(job))
+
+
+class CancelTrainingJob(TrainingJobStatus):
+
+    def post(self, request, job_id=None):
+        job = cancel_job(self.get_job(request, job_id))
+
+        return JsonResponse(job_to_dict(job))
+
+
+MSGPACK_CONTENT_TYPE = 'application/x-msgpack'
+
+
+class PredictModel(BaseUserView):
+    """Predicts the target for rows posted as JSON or msgpack.
+
+    The body is either a list of rows or {"rows": [...]}. A row is an object
+    keyed by input column or a list of values in the model's input order.
+    """
+
+    def post(self, request, model_id=None):
+        model_obj = MLModel.objects.filter(id=model_id, parent_file__deleted_at=None).defer('data').select_related('parent_file').first()
+        if not model_obj:
+            raise Http404
+
+        if model_obj.parent_file.file_owner != request.user:
+            raise PermissionDenied
+
+        use_msgpack = 'msgpack' in (request.content_type or '')
+        if use_msgpack:
+            payload = msgpack.unpackb(request.body, raw=False)
         else:
-            acc = get_r2(first_data, second_data)
-            accuracy_type = 'R^2'
-            method_sm = 'Correlation'
+            payload = request.data
+
+        rows = payload.get('rows') if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise APIException("rows not provided")
+
+        batcher = get_batcher(model_obj)
+        try:
+            predictions = batcher.predict(rows)
+        except PredictionError as e:
+            return JsonResponse({'status_code': 400, 'messages': [str(e)]}, status=400)
 
         context = {
             'status_code': 200,
-            'accuracy': acc,
-            'accuracy_type': accuracy_type,
-            'method_sm': method_sm,
-            'num_rows': len(first_data),
+            'model_id': model_obj.id,
+            'target': batcher.target_column,
+            'predictions': predictions,
         }
 
+        if use_msgpack:
+            return HttpResponse(msgpack.packb(context, use_bin_type=True), content_type=MSGPACK_CONTENT_TYPE)
+
         return JsonResponse(context)